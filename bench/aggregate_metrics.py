@@ -13,62 +13,119 @@ from typing import Dict, List, Tuple
 PROFILE_SUMMARY = "profile_summary.tsv"
 CONTIG_SUMMARY = "contigs_per_rank.tsv"
 
-
-def read_tsv(path: Path) -> List[Dict[str, str]]:
+SUMMARY_FIELDS = [
+    "sample",
+    "tool",
+    "rank",
+    "L1_total_variation_pctpts",
+    "BrayCurtis_pct",
+    "Precision_%",
+    "Recall_%",
+    "F1_%",
+    "TP",
+    "FP",
+    "FN",
+]
+CONTIG_FIELDS = ["sample", "tool", "rank", "n", "correct", "accuracy_percent"]
+METRIC_KEYS = [
+    "L1_total_variation_pctpts",
+    "BrayCurtis_pct",
+    "Precision_%",
+    "Recall_%",
+    "F1_%",
+]
+LEADERBOARD_FIELDS = [
+    "tool",
+    "rank",
+    "samples",
+    "mean_L1_total_variation_pctpts",
+    "mean_BrayCurtis_pct",
+    "mean_Precision_%",
+    "mean_Recall_%",
+    "mean_F1_%",
+]
+
+Row = Tuple[str, ...]
+
+
+def read_tsv(path: Path, fields: List[str]) -> List[List[str]]:
+    """Return the requested ``fields`` of every row, in that order.
+
+    Column positions are resolved once from the header; missing columns and
+    short rows yield empty strings.
+    """
     with path.open(newline="") as handle:
-        reader = csv.DictReader(handle, delimiter="\t")
-        return [dict(row) for row in reader]
+        reader = csv.reader(handle, delimiter="\t")
+        header = next(reader, [])
+        index = {name: i for i, name in enumerate(header)}
+        cols = [index.get(name, -1) for name in fields]
+        return [[row[i] if 0 <= i < len(row) else "" for i in cols] for row in reader]
 
 
-def collect_eval(sample: str, tool: str, eval_dir: Path) -> Tuple[List[Dict[str, str]], List[Dict[str, str]]]:
+def collect_eval(sample: str, tool: str, eval_dir: Path) -> Tuple[List[Row], List[Row]]:
+    """Collect profile and contig rows laid out as SUMMARY_FIELDS / CONTIG_FIELDS."""
     prof_path = eval_dir / PROFILE_SUMMARY
     contig_path = eval_dir / CONTIG_SUMMARY
-    prof_rows: List[Dict[str, str]] = []
-    contig_rows: List[Dict[str, str]] = []
+    prof_rows: List[Row] = []
+    contig_rows: List[Row] = []
     if prof_path.is_file() and prof_path.stat().st_size > 0:
-        prof_rows = read_tsv(prof_path)
-        for row in prof_rows:
-            row.update({"sample": sample, "tool": tool})
+        prof_rows = [(sample, tool, *row) for row in read_tsv(prof_path, SUMMARY_FIELDS[2:])]
     if contig_path.is_file() and contig_path.stat().st_size > 0:
-        raw_rows = read_tsv(contig_path)
-        filtered_rows: List[Dict[str, str]] = []
-        for row in raw_rows:
-            n_val = (row.get("n") or "").strip()
+        n_pos = CONTIG_FIELDS.index("n") - 2
+        for row in read_tsv(contig_path, CONTIG_FIELDS[2:]):
             try:
-                n_float = float(n_val)
+                n_float = float(row[n_pos].strip())
             except ValueError:
                 continue
             if n_float <= 0:
                 continue
-            row.update({"sample": sample, "tool": tool})
-            filtered_rows.append(row)
-        contig_rows = filtered_rows
+            contig_rows.append((sample, tool, *row))
     return prof_rows, contig_rows
 
 
-def average_metrics(rows: List[Dict[str, str]], keys: List[str]) -> Dict[str, float]:
-    agg = {k: 0.0 for k in keys}
-    count = {k: 0 for k in keys}
-    for row in rows:
-        for key in keys:
-            val = row.get(key)
-            if val is None or val == "":
-                continue
-            try:
-                agg[key] += float(val)
-                count[key] += 1
-            except ValueError:
-                continue
-    return {k: (agg[k] / count[k] if count[k] else 0.0) for k in keys}
+def accumulate_metrics(row: Row, columns: List[int], totals: List[float], counts: List[int]) -> None:
+    """Add each numeric column of ``row`` into running totals, skipping empty and non-numeric cells."""
+    for pos, col in enumerate(columns):
+        val = row[col]
+        if val == "":
+            continue
+        try:
+            totals[pos] += float(val)
+            counts[pos] += 1
+        except ValueError:
+            continue
+
+
+class SummaryWriter:
+    """TSV writer that only creates its file once the first row arrives."""
 
+    def __init__(self, path: Path, fieldnames: List[str]) -> None:
+        self.path = path
+        self.fieldnames = fieldnames
+        self._handle = None
+        self._writer = None
 
-def write_summary(path: Path, rows: List[Dict[str, str]], fieldnames: List[str]) -> None:
-    path.parent.mkdir(parents=True, exist_ok=True)
-    with path.open("w", newline="") as handle:
-        writer = csv.DictWriter(handle, fieldnames=fieldnames, delimiter="\t")
-        writer.writeheader()
-        for row in rows:
-            writer.writerow({k: row.get(k, "") for k in fieldnames})
+    def writerows(self, rows: List[Row]) -> None:
+        if not rows:
+            return
+        if self._writer is None:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            self._handle = self.path.open("w", newline="")
+            self._writer = csv.writer(self._handle, delimiter="\t")
+            self._writer.writerow(self.fieldnames)
+        self._writer.writerows(rows)
+
+    def close(self) -> None:
+        if self._handle is not None:
+            self._handle.close()
+
+
+def write_summary(path: Path, rows: List[Row], fieldnames: List[str]) -> None:
+    writer = SummaryWriter(path, fieldnames)
+    try:
+        writer.writerows(rows)
+    finally:
+        writer.close()
 
 
 def main() -> None:
@@ -81,84 +138,65 @@ def main() -> None:
     out_root = bench_root / args.outdir
     out_root.mkdir(parents=True, exist_ok=True)
 
-    per_sample_rows: List[Dict[str, str]] = []
-    contig_rows: List[Dict[str, str]] = []
-
     sample_root = bench_root / "out"
     if not sample_root.is_dir():
         print(f"[aggregate] No benchmark outputs under {sample_root}; skipping aggregation.")
         return
 
-    sample_dirs = [p for p in sample_root.iterdir() if p.is_dir()]
-    for sdir in sorted(sample_dirs, key=lambda p: p.name):
-        sample = sdir.name
-        for tool_dir in sorted([p for p in sdir.iterdir() if p.is_dir()]):
-            tool = tool_dir.name
-            eval_dir = tool_dir / "eval"
-            if not eval_dir.is_dir():
-                continue
-            prof_rows, cont_rows = collect_eval(sample, tool, eval_dir)
-            per_sample_rows.extend(prof_rows)
-            contig_rows.extend(cont_rows)
-
-    if per_sample_rows:
-        summary_fields = [
-            "sample",
-            "tool",
-            "rank",
-            "L1_total_variation_pctpts",
-            "BrayCurtis_pct",
-            "Precision_%",
-            "Recall_%",
-            "F1_%",
-            "TP",
-            "FP",
-            "FN",
-        ]
-        write_summary(out_root / "summary_per_tool_per_sample.tsv", per_sample_rows, summary_fields)
-
-        metrics_by_tool_rank: Dict[Tuple[str, str], List[Dict[str, str]]] = defaultdict(list)
-        for row in per_sample_rows:
-            metrics_by_tool_rank[(row["tool"], row["rank"])].append(row)
-
-        leaderboard_rows: List[Dict[str, str]] = []
-        metric_keys = [
-            "L1_total_variation_pctpts",
-            "BrayCurtis_pct",
-            "Precision_%",
-            "Recall_%",
-            "F1_%",
-        ]
-        for (tool, rank), rows in sorted(metrics_by_tool_rank.items()):
-            avg = average_metrics(rows, metric_keys)
+    # Rows are written out as each eval directory is read and folded into
+    # per-(tool, rank) running totals, so nothing is held for a second pass.
+    tool_col = SUMMARY_FIELDS.index("tool")
+    rank_col = SUMMARY_FIELDS.index("rank")
+    metric_cols = [SUMMARY_FIELDS.index(key) for key in METRIC_KEYS]
+    totals: Dict[Tuple[str, str], List[float]] = {}
+    counts: Dict[Tuple[str, str], List[int]] = {}
+    samples: Dict[Tuple[str, str], int] = defaultdict(int)
+
+    per_sample_out = SummaryWriter(out_root / "summary_per_tool_per_sample.tsv", SUMMARY_FIELDS)
+    contig_out = SummaryWriter(out_root / "contig_accuracy_per_tool.tsv", CONTIG_FIELDS)
+    try:
+        sample_dirs = [p for p in sample_root.iterdir() if p.is_dir()]
+        for sdir in sorted(sample_dirs, key=lambda p: p.name):
+            sample = sdir.name
+            for tool_dir in sorted([p for p in sdir.iterdir() if p.is_dir()]):
+                tool = tool_dir.name
+                eval_dir = tool_dir / "eval"
+                if not eval_dir.is_dir():
+                    continue
+                prof_rows, cont_rows = collect_eval(sample, tool, eval_dir)
+                per_sample_out.writerows(prof_rows)
+                contig_out.writerows(cont_rows)
+                for row in prof_rows:
+                    key = (row[tool_col], row[rank_col])
+                    if key not in totals:
+                        totals[key] = [0.0] * len(metric_cols)
+                        counts[key] = [0] * len(metric_cols)
+                    accumulate_metrics(row, metric_cols, totals[key], counts[key])
+                    samples[key] += 1
+    finally:
+        per_sample_out.close()
+        contig_out.close()
+
+    if totals:
+        leaderboard_rows: List[Row] = []
+        for (tool, rank) in sorted(totals):
+            l1, bray, precision, recall, f1 = (
+                total / n if n else 0.0 for total, n in zip(totals[(tool, rank)], counts[(tool, rank)])
+            )
             leaderboard_rows.append(
-                {
-                    "tool": tool,
-                    "rank": rank,
-                    "samples": str(len(rows)),
-                    "mean_L1_total_variation_pctpts": f"{avg['L1_total_variation_pctpts']:.4f}",
-                    "mean_BrayCurtis_pct": f"{avg['BrayCurtis_pct']:.4f}",
-                    "mean_Precision_%": f"{avg['Precision_%']:.2f}",
-                    "mean_Recall_%": f"{avg['Recall_%']:.2f}",
-                    "mean_F1_%": f"{avg['F1_%']:.2f}",
-                }
+                (
+                    tool,
+                    rank,
+                    str(samples[(tool, rank)]),
+                    f"{l1:.4f}",
+                    f"{bray:.4f}",
+                    f"{precision:.2f}",
+                    f"{recall:.2f}",
+                    f"{f1:.2f}",
+                )
             )
 
-        leaderboard_fields = [
-            "tool",
-            "rank",
-            "samples",
-            "mean_L1_total_variation_pctpts",
-            "mean_BrayCurtis_pct",
-            "mean_Precision_%",
-            "mean_Recall_%",
-            "mean_F1_%",
-        ]
-        write_summary(out_root / "leaderboard_by_rank.tsv", leaderboard_rows, leaderboard_fields)
-
-    if contig_rows:
-        contig_fields = ["sample", "tool", "rank", "n", "correct", "accuracy_percent"]
-        write_summary(out_root / "contig_accuracy_per_tool.tsv", contig_rows, contig_fields)
+        write_summary(out_root / "leaderboard_by_rank.tsv", leaderboard_rows, LEADERBOARD_FIELDS)
 
 
 if __name__ == "__main__":
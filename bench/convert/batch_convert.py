@@ -0,0 +1,93 @@
+#!/usr/bin/env python3
+"""Convert many tool outputs to CAMI format in parallel from a manifest.
+
+The manifest is a TSV with a header row and the columns ``tool``, ``input``,
+``sample_id`` and ``out``; ``seqmap`` (sourmash_gather only) and ``taxdb``
+are optional. Each row is converted in its own worker process.
+"""
+
+from __future__ import annotations
+
+import argparse
+import csv
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, List, Tuple
+
+if __package__ is None or __package__ == "":  # pragma: no cover - CLI fallback
+    sys.path.append(os.path.dirname(__file__))
+    from kreport import convert_kreport  # type: ignore
+    from metaphlan4_to_cami import convert_metaphlan  # type: ignore
+    from sourmash_gather_to_cami import convert_gather  # type: ignore
+else:  # pragma: no cover
+    from .kreport import convert_kreport
+    from .metaphlan4_to_cami import convert_metaphlan
+    from .sourmash_gather_to_cami import convert_gather
+
+KREPORT_TOOLS = {"kraken2", "bracken", "centrifuge", "ganon2", "sourmash", "kreport"}
+REQUIRED_COLUMNS = ("tool", "input", "sample_id", "out")
+
+
+def read_manifest(path: str) -> List[Dict[str, str]]:
+    with open(path, "r", newline="") as handle:
+        reader = csv.DictReader(handle, delimiter="\t")
+        missing = [col for col in REQUIRED_COLUMNS if col not in (reader.fieldnames or [])]
+        if missing:
+            raise ValueError(f"{path}: manifest is missing column(s): {', '.join(missing)}")
+        jobs = [{key: (value or "").strip() for key, value in row.items() if key} for row in reader]
+    return [job for job in jobs if job.get("tool") and not job["tool"].startswith("#")]
+
+
+def convert_one(job: Dict[str, str]) -> Tuple[str, str, str]:
+    """Run the converter for one manifest row; return ``(sample_id, tool, error)``."""
+    tool = job["tool"]
+    taxdb = job.get("taxdb") or os.environ.get("TAXONKIT_DB", "")
+    try:
+        if tool == "metaphlan4":
+            convert_metaphlan(job["input"], job["out"], job["sample_id"], tool, taxdb)
+        elif tool == "sourmash_gather":
+            if not job.get("seqmap"):
+                raise ValueError("sourmash_gather rows need a seqmap column")
+            convert_gather(job["input"], job["seqmap"], job["out"], job["sample_id"], tool, taxdb)
+        elif tool in KREPORT_TOOLS:
+            convert_kreport(job["input"], job["out"], job["sample_id"], tool)
+        else:
+            raise ValueError(f"unsupported tool '{tool}'")
+    except Exception as exc:  # reported per row; one bad input should not stop the batch
+        return job["sample_id"], tool, f"{type(exc).__name__}: {exc}"
+    return job["sample_id"], tool, ""
+
+
+def batch_convert(manifest_tsv: str, workers: int | None = None) -> int:
+    """Convert every manifest row and return the number of failed rows."""
+    # Rows for the same tool are submitted together so they hit the taxonkit
+    # cache for the same lookups back to back.
+    jobs = sorted(read_manifest(manifest_tsv), key=lambda job: job["tool"])
+    if not jobs:
+        return 0
+    workers = max(1, min(workers or os.cpu_count() or 1, len(jobs)))
+    failures = 0
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        for sample_id, tool, error in pool.map(convert_one, jobs):
+            if error:
+                failures += 1
+                print(f"[batch_convert] {sample_id}/{tool}: {error}", file=sys.stderr)
+            else:
+                print(f"[batch_convert] {sample_id}/{tool}: ok")
+    return failures
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description="Convert tool outputs listed in a manifest to CAMI format in parallel.")
+    ap.add_argument("--manifest", required=True, help="TSV with tool, input, sample_id, out[, seqmap, taxdb] columns.")
+    ap.add_argument("--workers", type=int, default=None, help="Worker processes (default: CPU count).")
+    args = ap.parse_args()
+
+    failures = batch_convert(args.manifest, args.workers)
+    if failures:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
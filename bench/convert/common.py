@@ -3,13 +3,19 @@
 
 from __future__ import annotations
 
-import csv
+import functools
+import math
 import os
 import pathlib
+import pickle
+import sqlite3
 import subprocess
-from typing import Iterable, List, Dict, Tuple
+import sys
+import threading
+from typing import Callable, Iterable, Iterator, List, Dict, Optional, Tuple
 
 RANKS: List[str] = ["superkingdom", "phylum", "class", "order", "family", "genus", "species"]
+RANK_INDEX: Dict[str, int] = {rank: idx for idx, rank in enumerate(RANKS)}
 RANK_CODES: Dict[str, str] = {
     "U": None,
     "R": None,
@@ -23,6 +29,53 @@ RANK_CODES: Dict[str, str] = {
     "S": "species",
 }
 
+# Resolved taxonkit lookups are cached on disk per taxonomy snapshot so that
+# repeated converter runs over the same database skip the subprocess. Set
+# HYMET_TAXONKIT_CACHE to an empty string to disable.
+TAXONKIT_CACHE = os.environ.get(
+    "HYMET_TAXONKIT_CACHE",
+    os.path.join(os.path.expanduser("~"), ".cache", "hymet", "taxonkit.sqlite"),
+)
+TAXONKIT_STDIN_CHUNK = 8192
+# Converter inputs (kreports, profiles, seqid maps) can run to hundreds of MB;
+# a large read buffer keeps the number of read() calls down.
+READ_BUFFER_SIZE = 1 << 20
+_TAXONKIT_MEMO: Dict[Tuple[str, str], Dict[str, Optional[Tuple[str, str]]]] = {}
+
+
+def load_cached_mapping(path: str, suffix: str, build: Callable[[str], Dict[str, str]]) -> Dict[str, str]:
+    """Return ``build(path)``, reusing a pickle kept at ``path + suffix``.
+
+    The pickle is only trusted while the source file's location, mtime and
+    size match what was recorded when it was written.
+    """
+    stat = os.stat(path)
+    key = (os.path.abspath(path), stat.st_mtime_ns, stat.st_size)
+    cache_path = path + suffix
+    try:
+        with open(cache_path, "rb") as handle:
+            cached_key, mapping = pickle.load(handle)
+        if cached_key == key:
+            return mapping
+    except FileNotFoundError:
+        pass
+    except (OSError, pickle.PickleError, EOFError, ValueError) as exc:
+        print(f"[convert] ignoring unreadable cache {cache_path}: {exc}", file=sys.stderr)
+
+    mapping = build(path)
+    tmp_path = f"{cache_path}.{os.getpid()}.tmp"
+    try:
+        with open(tmp_path, "wb") as handle:
+            pickle.dump((key, mapping), handle, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, cache_path)
+    except OSError as exc:
+        print(f"[convert] could not write cache {cache_path}: {exc}", file=sys.stderr)
+        try:
+            os.remove(tmp_path)
+        except OSError:
+            pass
+    return mapping
+
 
 def ensure_parent(path: str) -> None:
     pathlib.Path(path).expanduser().resolve().parent.mkdir(parents=True, exist_ok=True)
@@ -35,15 +88,24 @@ def default_taxpath() -> Tuple[List[str], List[str]]:
 
 
 def normalise_rows(rows: List[Dict[str, str]]) -> List[Dict[str, str]]:
-    total = sum(float(row.get("percentage", 0.0)) for row in rows)
+    values = [float(row.get("percentage", 0.0)) for row in rows]
+    total = math.fsum(values)
     if total <= 0:
         return rows
-    for row in rows:
-        row["percentage"] = 100.0 * float(row.get("percentage", 0.0)) / total
+    scale = 100.0 / total
+    for row, value in zip(rows, values):
+        row["percentage"] = value * scale
     return rows
 
 
+@functools.lru_cache(maxsize=4096)
+def _join_path(value: Tuple[str, ...]) -> str:
+    return "|".join(str(v) for v in value)
+
+
 def _format_path(value) -> str:
+    if isinstance(value, tuple):
+        return _join_path(value)
     if value is None:
         return "|".join(["NA"] * len(RANKS))
     if isinstance(value, str):
@@ -69,46 +131,157 @@ def write_cami_profile(
         handle.write("@Version:\t0.9.1\n")
         handle.write("@Ranks:\t" + "|".join(RANKS) + "\n")
         handle.write(f"@ToolID:\t{tool_name}\n")
-        writer = csv.writer(handle, delimiter="\t", lineterminator="\n")
-        writer.writerow(["@@TAXID", "RANK", "TAXPATH", "TAXPATHSN", "PERCENTAGE"])
+        handle.write("@@TAXID\tRANK\tTAXPATH\tTAXPATHSN\tPERCENTAGE\n")
+        # Fields never contain tabs or newlines, so format lines directly and
+        # hand them to the file in one call instead of csv.writer per row.
+        # Names with double quotes (e.g. '"Nostoc azollae" 0708') are written
+        # raw rather than csv-quoted, which is what the tab-splitting readers
+        # (fix_superkingdom_taxids, OPAL) expect.
+        lines = []
         for row in rows:
             taxid = str(row.get("taxid", "NA")).strip() or "NA"
             rank = str(row.get("rank", "unknown")).lower()
             taxpath = _format_path(row.get("taxpath"))
             taxpathsn = _format_path(row.get("taxpathsn"))
             perc = float(row.get("percentage", 0.0))
-            writer.writerow([
-                taxid,
-                rank,
-                taxpath,
-                taxpathsn,
-                f"{perc:.6f}",
-            ])
+            lines.append(f"{taxid}\t{rank}\t{taxpath}\t{taxpathsn}\t{perc:.6f}\n")
+        handle.writelines(lines)
 
 
-def _run_taxonkit(args, stdin, taxdb: str) -> subprocess.CompletedProcess:
+def _run_taxonkit(args, keys: List[str], taxdb: str) -> Iterator[str]:
+    """Run taxonkit over ``keys`` and yield its stdout lines as they arrive.
+
+    Input is fed from a background thread in chunks so taxonkit can start
+    working (and we can start parsing) before the whole list is written.
+    """
     env = os.environ.copy()
     if taxdb:
         env["TAXONKIT_DB"] = taxdb
     try:
-        proc = subprocess.run(
+        proc = subprocess.Popen(
             args,
-            input=stdin,
-            text=True,
-            capture_output=True,
-            check=True,
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
             env=env,
         )
     except FileNotFoundError as exc:
         raise RuntimeError("taxonkit executable not found. Please install taxonkit and ensure TAXONKIT_DB points to the NCBI taxonomy directory.") from exc
-    return proc
 
+    stderr_chunks: List[bytes] = []
 
-def taxonkit_taxpath(taxids: Iterable[str], taxdb: str) -> Dict[str, Tuple[str, str]]:
-    tids = [t for t in dict.fromkeys(taxids) if t and t != "NA"]
-    if not tids:
-        return {}
-    proc = _run_taxonkit(
+    def feed() -> None:
+        try:
+            for start in range(0, len(keys), TAXONKIT_STDIN_CHUNK):
+                proc.stdin.write(("\n".join(keys[start : start + TAXONKIT_STDIN_CHUNK]) + "\n").encode())
+        except BrokenPipeError:
+            pass
+        finally:
+            try:
+                proc.stdin.close()
+            except BrokenPipeError:
+                pass
+
+    def drain() -> None:
+        stderr_chunks.append(proc.stderr.read())
+
+    threads = [threading.Thread(target=feed, daemon=True), threading.Thread(target=drain, daemon=True)]
+    for thread in threads:
+        thread.start()
+    try:
+        for line in proc.stdout:
+            yield line.decode().rstrip("\r\n")
+    finally:
+        proc.stdout.close()
+        for thread in threads:
+            thread.join()
+        returncode = proc.wait()
+    if returncode != 0:
+        raise subprocess.CalledProcessError(returncode, args, stderr=b"".join(stderr_chunks).decode(errors="replace"))
+
+
+def _taxdb_stamp(taxdb: str) -> str:
+    """Identify a taxonomy snapshot by its location and dump file mtimes/sizes."""
+    data_dir = taxdb or os.environ.get("TAXONKIT_DB") or os.path.join(os.path.expanduser("~"), ".taxonkit")
+    parts = [os.path.abspath(data_dir)]
+    for name in ("nodes.dmp", "names.dmp", "merged.dmp", "delnodes.dmp"):
+        try:
+            st = os.stat(os.path.join(data_dir, name))
+        except OSError:
+            parts.append(f"{name}:-")
+        else:
+            parts.append(f"{name}:{st.st_mtime_ns}:{st.st_size}")
+    return "|".join(parts)
+
+
+def _open_taxonkit_cache() -> sqlite3.Connection | None:
+    if not TAXONKIT_CACHE:
+        return None
+    try:
+        pathlib.Path(TAXONKIT_CACHE).parent.mkdir(parents=True, exist_ok=True)
+        conn = sqlite3.connect(TAXONKIT_CACHE, timeout=30)
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS taxonkit ("
+            "kind TEXT, stamp TEXT, key TEXT, value TEXT, PRIMARY KEY (kind, stamp, key))"
+        )
+        return conn
+    except (OSError, sqlite3.Error) as exc:
+        print(f"[convert] taxonkit cache disabled ({TAXONKIT_CACHE}): {exc}", file=sys.stderr)
+        return None
+
+
+def _cached_taxonkit(
+    kind: str,
+    keys: List[str],
+    taxdb: str,
+    fetch: Callable[[List[str], str], Dict[str, Tuple[str, str]]],
+) -> Dict[str, Tuple[str, str]]:
+    """Resolve ``keys`` through the in-process memo, then the on-disk cache,
+    and only run taxonkit for what is still missing.
+
+    Keys taxonkit cannot resolve are remembered too (as ``None``) so repeated
+    runs do not keep re-querying them.
+    """
+    stamp = _taxdb_stamp(taxdb)
+    memo = _TAXONKIT_MEMO.setdefault((kind, stamp), {})
+    missing = [key for key in keys if key not in memo]
+    conn = _open_taxonkit_cache() if missing else None
+    try:
+        if conn is not None:
+            for start in range(0, len(missing), 500):
+                chunk = missing[start : start + 500]
+                placeholders = ",".join("?" * len(chunk))
+                for key, value in conn.execute(
+                    f"SELECT key, value FROM taxonkit WHERE kind = ? AND stamp = ? AND key IN ({placeholders})",
+                    [kind, stamp, *chunk],
+                ):
+                    memo[key] = tuple(value.split("\t", 1)) if value else None
+            missing = [key for key in missing if key not in memo]
+        if missing:
+            fetched = fetch(missing, taxdb)
+            for key in missing:
+                memo[key] = fetched.get(key)
+            if conn is not None:
+                with conn:
+                    conn.executemany(
+                        "INSERT OR REPLACE INTO taxonkit (kind, stamp, key, value) VALUES (?, ?, ?, ?)",
+                        [(kind, stamp, key, "\t".join(memo[key]) if memo[key] else "") for key in missing],
+                    )
+    except sqlite3.Error as exc:
+        print(f"[convert] taxonkit cache error ({TAXONKIT_CACHE}): {exc}", file=sys.stderr)
+        missing = [key for key in keys if key not in memo]
+        if missing:
+            fetched = fetch(missing, taxdb)
+            for key in missing:
+                memo[key] = fetched.get(key)
+    finally:
+        if conn is not None:
+            conn.close()
+    return {key: memo[key] for key in keys if memo.get(key) is not None}
+
+
+def _fetch_taxpath(tids: List[str], taxdb: str) -> Dict[str, Tuple[str, str]]:
+    lines = _run_taxonkit(
         [
             "taxonkit",
             "reformat",
@@ -119,29 +292,55 @@ def taxonkit_taxpath(taxids: Iterable[str], taxdb: str) -> Dict[str, Tuple[str,
             "-t",
         ]
         + (["--data-dir", taxdb] if taxdb else []),
-        "\n".join(tids) + "\n",
+        tids,
         taxdb,
     )
     mapping: Dict[str, Tuple[str, str]] = {}
-    for line in proc.stdout.splitlines():
+    for line in lines:
         parts = line.split("\t")
         if len(parts) >= 3:
             mapping[parts[0]] = (parts[1], parts[2])
     return mapping
 
 
-def taxonkit_name2taxid(names: Iterable[str], taxdb: str) -> Dict[str, Tuple[str, str]]:
-    unique = [n for n in dict.fromkeys(names) if n and n.lower() != "unclassified"]
-    if not unique:
-        return {}
-    proc = _run_taxonkit(
+def _fetch_name2taxid(names: List[str], taxdb: str) -> Dict[str, Tuple[str, str]]:
+    lines = _run_taxonkit(
         ["taxonkit", "name2taxid", "--show-rank"] + (["--data-dir", taxdb] if taxdb else []),
-        "\n".join(unique) + "\n",
+        names,
         taxdb,
     )
     mapping: Dict[str, Tuple[str, str]] = {}
-    for line in proc.stdout.splitlines():
+    for line in lines:
         parts = line.split("\t")
         if len(parts) >= 3 and parts[1].isdigit():
             mapping[parts[0]] = (parts[1], parts[2])
     return mapping
+
+
+def _unique(values: Iterable[str], skip: Callable[[str], bool]) -> List[str]:
+    """First occurrence of each non-empty value not rejected by ``skip``, in input order."""
+    seen: set = set()
+    out: List[str] = []
+    for value in values:
+        if value and value not in seen and not skip(value):
+            seen.add(value)
+            out.append(value)
+    return out
+
+
+def taxonkit_taxpath(taxids: Iterable[str], taxdb: str) -> Dict[str, Tuple[Tuple[str, ...], Tuple[str, ...]]]:
+    """Map each taxid to its ``(taxid path, name path)`` as per-rank tuples."""
+    tids = _unique(taxids, lambda t: t == "NA")
+    if not tids:
+        return {}
+    paths = _cached_taxonkit("taxpath", tids, taxdb, _fetch_taxpath)
+    # taxonkit (and the cache) hand back pipe-joined strings; split them once
+    # here so callers can use the tuples directly.
+    return {tid: (tuple(ids.split("|")), tuple(names.split("|"))) for tid, (ids, names) in paths.items()}
+
+
+def taxonkit_name2taxid(names: Iterable[str], taxdb: str) -> Dict[str, Tuple[str, str]]:
+    unique = _unique(names, lambda n: n.lower() == "unclassified")
+    if not unique:
+        return {}
+    return _cached_taxonkit("name2taxid", unique, taxdb, _fetch_name2taxid)
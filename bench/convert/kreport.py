@@ -6,23 +6,23 @@ from __future__ import annotations
 import argparse
 import os
 import sys
-from typing import Dict, Iterable, List, Tuple
+from typing import Dict, Iterable, List
 
 if __package__ is None or __package__ == "":  # pragma: no cover - CLI fallback
     sys.path.append(os.path.dirname(__file__))
-    from common import RANKS, RANK_CODES, default_taxpath, write_cami_profile  # type: ignore
+    from common import RANKS, RANK_CODES, RANK_INDEX, READ_BUFFER_SIZE, default_taxpath, write_cami_profile  # type: ignore
 else:  # pragma: no cover
-    from .common import RANKS, RANK_CODES, default_taxpath, write_cami_profile
+    from .common import RANKS, RANK_CODES, RANK_INDEX, READ_BUFFER_SIZE, default_taxpath, write_cami_profile
 
 
 def parse_kreport(report_path: str) -> List[Dict[str, object]]:
     rows: List[Dict[str, object]] = []
-    rank_state: Dict[str, Dict[str, str]] = {
-        rank: {"taxid": "NA", "name": "NA"} for rank in RANKS
-    }
-    stack: List[Tuple[str, str, str]] = []
+    # Current lineage as two fixed-length lists indexed by RANK_INDEX.
+    rank_taxid: List[str] = ["NA"] * len(RANKS)
+    rank_name: List[str] = ["NA"] * len(RANKS)
+    stack: List[str] = []
 
-    with open(report_path, "r") as handle:
+    with open(report_path, "r", buffering=READ_BUFFER_SIZE) as handle:
         for raw_line in handle:
             if not raw_line.strip():
                 continue
@@ -44,34 +44,41 @@ def parse_kreport(report_path: str) -> List[Dict[str, object]]:
             name = name_field.strip() or taxid or "unknown"
 
             while len(stack) > depth:
-                code, _, _ = stack.pop()
-                mapped = RANK_CODES.get(code)
-                if mapped in rank_state:
-                    rank_state[mapped] = {"taxid": "NA", "name": "NA"}
+                idx = RANK_INDEX.get(RANK_CODES.get(stack.pop()))
+                if idx is not None:
+                    rank_taxid[idx] = "NA"
+                    rank_name[idx] = "NA"
 
-            stack.append((rank_code, taxid, name))
+            stack.append(rank_code)
             mapped_rank = RANK_CODES.get(rank_code)
 
             if mapped_rank:
-                rank_state[mapped_rank] = {"taxid": taxid, "name": name}
-                for lower in RANKS[RANKS.index(mapped_rank) + 1 :]:
-                    rank_state[lower] = {"taxid": "NA", "name": "NA"}
+                idx = RANK_INDEX[mapped_rank]
+                rank_taxid[idx] = taxid
+                rank_name[idx] = name
+                for lower in range(idx + 1, len(RANKS)):
+                    rank_taxid[lower] = "NA"
+                    rank_name[lower] = "NA"
 
             if mapped_rank and perc > 0.0 and taxid not in {"0", "", "NA"}:
-                taxpath = [rank_state[r]["taxid"] for r in RANKS]
-                names = [rank_state[r]["name"] for r in RANKS]
                 rows.append(
                     {
                         "taxid": taxid,
                         "rank": mapped_rank,
-                        "taxpath": taxpath,
-                        "taxpathsn": names,
+                        "taxpath": list(rank_taxid),
+                        "taxpathsn": list(rank_name),
                         "percentage": perc,
                     }
                 )
     return rows
 
 
+def convert_kreport(report_path: str, out_path: str, sample_id: str, tool: str) -> None:
+    """Convert one kreport-style table into a normalised CAMI profile."""
+    rows = parse_kreport(report_path)
+    write_cami_profile(rows, out_path, sample_id=sample_id, tool_name=tool, normalise=True)
+
+
 def main() -> None:
     ap = argparse.ArgumentParser(description="Convert Kraken-style reports to CAMI format.")
     ap.add_argument("--report", required=True, help="Input kreport file.")
@@ -80,8 +87,7 @@ def main() -> None:
     ap.add_argument("--tool", default="unknown", help="Tool identifier.")
     args = ap.parse_args()
 
-    rows = parse_kreport(args.report)
-    write_cami_profile(rows, args.out, sample_id=args.sample_id, tool_name=args.tool, normalise=True)
+    convert_kreport(args.report, args.out, args.sample_id, args.tool)
 
 
 if __name__ == "__main__":
@@ -4,20 +4,21 @@
 from __future__ import annotations
 
 import argparse
+import functools
 import os
 import sys
 from typing import Dict, List, Tuple
 
 if __package__ is None or __package__ == "":  # pragma: no cover - CLI fallback
     sys.path.append(os.path.dirname(__file__))
-    from common import RANKS, taxonkit_name2taxid, taxonkit_taxpath, write_cami_profile  # type: ignore
+    from common import RANKS, READ_BUFFER_SIZE, taxonkit_name2taxid, taxonkit_taxpath, write_cami_profile  # type: ignore
 else:  # pragma: no cover
-    from .common import RANKS, taxonkit_name2taxid, taxonkit_taxpath, write_cami_profile
+    from .common import RANKS, READ_BUFFER_SIZE, taxonkit_name2taxid, taxonkit_taxpath, write_cami_profile
 
 
 def read_metaphlan(path: str) -> List[Tuple[str, float]]:
     rows: List[Tuple[str, float]] = []
-    with open(path, "r") as handle:
+    with open(path, "r", buffering=READ_BUFFER_SIZE) as handle:
         for raw in handle:
             raw = raw.strip()
             if not raw or raw.startswith("#"):
@@ -34,7 +35,13 @@ def read_metaphlan(path: str) -> List[Tuple[str, float]]:
     return rows
 
 
-def lineage_to_ranked_names(lineage: str) -> Dict[str, str]:
+@functools.lru_cache(maxsize=None)
+def lineage_to_ranked_names(lineage: str) -> Tuple[Tuple[str, str], ...]:
+    """Return ``(rank, name)`` pairs parsed from a MetaPhlAn clade string.
+
+    Cached so repeated lookups of a clade are free; the result is a tuple so
+    it is safe to share between callers.
+    """
     out: Dict[str, str] = {}
     components = lineage.split("|")
     for comp in components:
@@ -57,38 +64,32 @@ def lineage_to_ranked_names(lineage: str) -> Dict[str, str]:
             out["genus"] = name
         elif prefix == "s":
             out["species"] = name
-    return out
+    return tuple(out.items())
 
 
-def main() -> None:
-    ap = argparse.ArgumentParser(description="Convert MetaPhlAn4 profiles to CAMI format.")
-    ap.add_argument("--input", required=True, help="MetaPhlAn profile TSV.")
-    ap.add_argument("--out", required=True, help="Output CAMI TSV.")
-    ap.add_argument("--sample-id", required=True, help="Sample identifier.")
-    ap.add_argument("--tool", default="metaphlan4", help="Tool identifier.")
-    ap.add_argument("--taxdb", default=os.environ.get("TAXONKIT_DB", ""), help="TaxonKit database directory.")
-    args = ap.parse_args()
-
-    records = read_metaphlan(args.input)
+def convert_metaphlan(input_path: str, out_path: str, sample_id: str, tool: str = "metaphlan4", taxdb: str = "") -> None:
+    """Convert one MetaPhlAn profile into a CAMI profile at ``out_path``."""
+    records = read_metaphlan(input_path)
     if not records:
-        write_cami_profile([], args.out, args.sample_id, args.tool, normalise=False)
+        write_cami_profile([], out_path, sample_id, tool, normalise=False)
         return
 
-    final_names = []
-    for lineage, _ in records:
-        ranked = lineage_to_ranked_names(lineage)
-        for rank in reversed(RANKS):
-            if rank in ranked:
-                final_names.append(ranked[rank])
-                break
+    # One pass resolves each record's deepest rank; both the name lookup and
+    # the row builder below reuse it.
+    resolved: List[Tuple[Dict[str, str], str, str, float]] = []
+    for lineage, abundance in records:
+        ranked = dict(lineage_to_ranked_names(lineage))
+        target_rank = next((rank for rank in reversed(RANKS) if rank in ranked), "species")
+        resolved.append((ranked, target_rank, ranked.get(target_rank, ""), abundance))
+
+    final_names = [name for _, _, name, _ in resolved if name]
 
-    name_to_taxid = taxonkit_name2taxid(final_names, args.taxdb)
+    name_to_taxid = taxonkit_name2taxid(final_names, taxdb)
     taxids = [taxid for taxid, _ in name_to_taxid.values()]
-    taxid_to_paths = taxonkit_taxpath(taxids, args.taxdb)
+    taxid_to_paths = taxonkit_taxpath(taxids, taxdb)
 
     cami_rows = []
-    for lineage, abundance in records:
-        ranked = lineage_to_ranked_names(lineage)
+    for ranked, target_rank, _, abundance in resolved:
         taxid = "NA"
         for rank in reversed(RANKS):
             nm = ranked.get(rank)
@@ -96,29 +97,34 @@ def main() -> None:
                 candidate, c_rank = name_to_taxid[nm]
                 if candidate in taxid_to_paths:
                     taxid = candidate
-                    ids_str, names_str = taxid_to_paths[candidate]
-                    taxpath = ids_str.split("|")
-                    names = names_str.split("|")
+                    taxpath, names = taxid_to_paths[candidate]
                     break
         else:
             taxpath = ["NA"] * len(RANKS)
             names = ["NA"] * len(RANKS)
-        target_rank = None
-        for rank in reversed(RANKS):
-            if rank in ranked:
-                target_rank = rank
-                break
         cami_rows.append(
             {
                 "taxid": taxid,
-                "rank": target_rank or "species",
+                "rank": target_rank,
                 "taxpath": taxpath,
                 "taxpathsn": names,
                 "percentage": abundance,
             }
         )
 
-    write_cami_profile(cami_rows, args.out, args.sample_id, args.tool, normalise=True)
+    write_cami_profile(cami_rows, out_path, sample_id, tool, normalise=True)
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description="Convert MetaPhlAn4 profiles to CAMI format.")
+    ap.add_argument("--input", required=True, help="MetaPhlAn profile TSV.")
+    ap.add_argument("--out", required=True, help="Output CAMI TSV.")
+    ap.add_argument("--sample-id", required=True, help="Sample identifier.")
+    ap.add_argument("--tool", default="metaphlan4", help="Tool identifier.")
+    ap.add_argument("--taxdb", default=os.environ.get("TAXONKIT_DB", ""), help="TaxonKit database directory.")
+    args = ap.parse_args()
+
+    convert_metaphlan(args.input, args.out, args.sample_id, args.tool, args.taxdb)
 
 
 if __name__ == "__main__":
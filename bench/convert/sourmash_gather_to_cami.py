@@ -8,21 +8,32 @@ import csv
 import os
 import sys
 import re
-from collections import defaultdict
 from typing import Dict, Iterable, List
 
+import numpy as np
+
 if __package__ is None or __package__ == "":  # pragma: no cover - CLI fallback
     sys.path.append(os.path.dirname(__file__))
-    from common import RANKS, normalise_rows, taxonkit_taxpath, write_cami_profile  # type: ignore
+    from common import RANKS, READ_BUFFER_SIZE, load_cached_mapping, normalise_rows, taxonkit_taxpath, write_cami_profile  # type: ignore
 else:  # pragma: no cover
-    from .common import RANKS, normalise_rows, taxonkit_taxpath, write_cami_profile
+    from .common import RANKS, READ_BUFFER_SIZE, load_cached_mapping, normalise_rows, taxonkit_taxpath, write_cami_profile
+
+
+FRACTION_COLUMNS = ["f_unique_to_query", "fraction_unique_to_query", "unique_fraction"]
+NAME_COLUMNS = ["name", "match_name", "filename"]
+TOKEN_SPLIT_RE = re.compile(r"[\s\|,;]+")
+SEPARATOR_CHARS = frozenset("|,;")
 
 
 def load_seqid_map(path: str) -> Dict[str, str]:
-    mapping: Dict[str, str] = {}
     if not path or not os.path.exists(path):
         raise FileNotFoundError(f"seqid2taxid map not found: {path}")
-    with open(path, "r") as handle:
+    return load_cached_mapping(path, ".seqmap.pkl", _parse_seqid_map)
+
+
+def _parse_seqid_map(path: str) -> Dict[str, str]:
+    mapping: Dict[str, str] = {}
+    with open(path, "r", buffering=READ_BUFFER_SIZE) as handle:
         for line in handle:
             line = line.strip()
             if not line:
@@ -33,6 +44,8 @@ def load_seqid_map(path: str) -> Dict[str, str]:
             seqid, taxid = parts[0].strip(), parts[1].strip()
             if not seqid or not taxid:
                 continue
+            # Many seqids share a taxid; interning keeps one copy of each.
+            taxid = sys.intern(taxid)
             mapping.setdefault(seqid, taxid)
             if "." in seqid:
                 mapping.setdefault(seqid.split(".", 1)[0], taxid)
@@ -46,11 +59,21 @@ def lookup_taxid(name: str, seqmap: Dict[str, str]) -> str | None:
     cleaned = name.strip()
     if not cleaned:
         return None
+    # Fast path: a plain leading accession (no '|', ',' or ';') is also the
+    # first regex token, so checking it first cannot change the result.
+    first = cleaned.split(None, 1)[0]
+    if not SEPARATOR_CHARS.intersection(first):
+        if first in seqmap:
+            return seqmap[first]
+        if "." in first:
+            base = first.split(".", 1)[0]
+            if base in seqmap:
+                return seqmap[base]
     # direct match and whitespace/pipe delimiters
-    tokens = re.split(r"[\s\|,;]+", cleaned)
+    tokens = TOKEN_SPLIT_RE.split(cleaned)
     candidates.extend(tokens)
     # also consider removing trailing descriptions
-    candidates.append(cleaned.split()[0])
+    candidates.append(first)
     for cand in candidates:
         cand = cand.strip()
         if not cand:
@@ -65,63 +88,72 @@ def lookup_taxid(name: str, seqmap: Dict[str, str]) -> str | None:
 
 
 def gather_rows(gather_csv: str, seqmap: Dict[str, str]) -> Dict[str, float]:
-    totals: Dict[str, float] = defaultdict(float)
-    with open(gather_csv, "r", newline="") as handle:
-        reader = csv.DictReader(handle)
-        frac_keys = [
-            "f_unique_to_query",
-            "fraction_unique_to_query",
-            "unique_fraction",
-        ]
-        name_keys = ["name", "match_name", "filename"]
+    fracs: List[float] = []
+    taxids: List[str] = []
+    with open(gather_csv, "r", newline="", buffering=READ_BUFFER_SIZE) as handle:
+        reader = csv.reader(handle)
+        header = next(reader, None)
+        if header is None:
+            return {}
+        # Resolve candidate columns once, in preference order, instead of
+        # probing a dict per row.
+        index = {column: pos for pos, column in enumerate(header)}
+        frac_cols = [index[key] for key in FRACTION_COLUMNS if key in index]
+        name_cols = [index[key] for key in NAME_COLUMNS if key in index]
         for row in reader:
             if not row:
                 continue
+            width = len(row)
             frac = None
-            for key in frac_keys:
-                if key in row and row[key]:
+            for col in frac_cols:
+                if col < width and row[col]:
                     try:
-                        frac = float(row[key])
+                        frac = float(row[col])
                         break
                     except ValueError:
                         continue
             if frac is None or frac <= 0.0:
                 continue
             name_val = None
-            for key in name_keys:
-                if key in row and row[key]:
-                    name_val = row[key]
+            for col in name_cols:
+                if col < width and row[col]:
+                    name_val = row[col]
                     break
             taxid = lookup_taxid(name_val or "", seqmap)
             if not taxid:
                 continue
-            totals[taxid] += frac * 100.0
-    return totals
-
-
-def main() -> None:
-    ap = argparse.ArgumentParser(description="Convert sourmash gather output to CAMI profile format.")
-    ap.add_argument("--gather", required=True, help="sourmash gather CSV output")
-    ap.add_argument("--seqmap", required=True, help="seqid2taxid map (from make_seqid_map.py)")
-    ap.add_argument("--taxdb", default=os.environ.get("TAXONKIT_DB", ""), help="TaxonKit database directory")
-    ap.add_argument("--out", required=True, help="Output CAMI profile path")
-    ap.add_argument("--sample-id", required=True, help="Sample identifier")
-    ap.add_argument("--tool", default="sourmash_gather", help="Tool name for CAMI header")
-    args = ap.parse_args()
-
-    seqmap = load_seqid_map(args.seqmap)
-    totals = gather_rows(args.gather, seqmap)
+            fracs.append(frac)
+            taxids.append(taxid)
+    if not taxids:
+        return {}
+    # Group by taxid in first-seen order and let bincount do the summation.
+    slots: Dict[str, int] = {}
+    groups = [slots.setdefault(taxid, len(slots)) for taxid in taxids]
+    totals = np.bincount(groups, weights=np.asarray(fracs, dtype=np.float64) * 100.0, minlength=len(slots))
+    return dict(zip(slots, totals.tolist()))
+
+
+def convert_gather(
+    gather_csv: str,
+    seqmap_path: str,
+    out_path: str,
+    sample_id: str,
+    tool: str = "sourmash_gather",
+    taxdb: str = "",
+) -> None:
+    """Convert one sourmash gather CSV into a CAMI profile at ``out_path``."""
+    seqmap = load_seqid_map(seqmap_path)
+    totals = gather_rows(gather_csv, seqmap)
     if not totals:
-        write_cami_profile([], args.out, args.sample_id, args.tool, normalise=False)
+        write_cami_profile([], out_path, sample_id, tool, normalise=False)
         return
 
-    tax_paths = taxonkit_taxpath(totals.keys(), args.taxdb)
+    tax_paths = taxonkit_taxpath(totals.keys(), taxdb)
 
     rows = []
+    na_path = ("NA",) * len(RANKS)
     for taxid, percentage in totals.items():
-        ids_str, names_str = tax_paths.get(taxid, ("|".join(["NA"] * len(RANKS)), "|".join(["NA"] * len(RANKS))))
-        tax_ids = ids_str.split("|")
-        tax_names = names_str.split("|")
+        tax_ids, tax_names = tax_paths.get(taxid, (na_path, na_path))
         rank = "species"
         for idx in range(len(RANKS) - 1, -1, -1):
             if idx < len(tax_ids) and tax_ids[idx] not in {"", "NA"}:
@@ -138,7 +170,20 @@ def main() -> None:
         )
 
     rows = normalise_rows(rows)
-    write_cami_profile(rows, args.out, args.sample_id, args.tool, normalise=False)
+    write_cami_profile(rows, out_path, sample_id, tool, normalise=False)
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description="Convert sourmash gather output to CAMI profile format.")
+    ap.add_argument("--gather", required=True, help="sourmash gather CSV output")
+    ap.add_argument("--seqmap", required=True, help="seqid2taxid map (from make_seqid_map.py)")
+    ap.add_argument("--taxdb", default=os.environ.get("TAXONKIT_DB", ""), help="TaxonKit database directory")
+    ap.add_argument("--out", required=True, help="Output CAMI profile path")
+    ap.add_argument("--sample-id", required=True, help="Sample identifier")
+    ap.add_argument("--tool", default="sourmash_gather", help="Tool name for CAMI header")
+    args = ap.parse_args()
+
+    convert_gather(args.gather, args.seqmap, args.out, args.sample_id, args.tool, args.taxdb)
 
 
 if __name__ == "__main__":
@@ -5,13 +5,26 @@ from __future__ import annotations
 
 import argparse
 import csv
+import mmap
+import os
 import re
-from typing import Dict
+import sys
+from typing import Dict, Iterator, List
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "convert"))
+from common import READ_BUFFER_SIZE, load_cached_mapping  # type: ignore
+
+TOKEN_SPLIT_RE = re.compile(r"[\s|,;]+")
 
 
 def load_id_map(path: str) -> Dict[str, str]:
+    """Load the taxonomy map, reusing ``<path>.idmap.pkl`` while the TSV is unchanged."""
+    return load_cached_mapping(path, ".idmap.pkl", _parse_id_map)
+
+
+def _parse_id_map(path: str) -> Dict[str, str]:
     out: Dict[str, str] = {}
-    with open(path, newline="") as handle:
+    with open(path, newline="", buffering=READ_BUFFER_SIZE) as handle:
         reader = csv.reader(handle, delimiter="\t")
         for row in reader:
             if len(row) < 2:
@@ -19,12 +32,42 @@ def load_id_map(path: str) -> Dict[str, str]:
             key = row[0].strip()
             tax = row[1].strip()
             if key and tax and key not in out:
+                tax = sys.intern(tax)
                 out[key] = tax
                 if "." in key:
                     out.setdefault(key.split(".", 1)[0], tax)
     return out
 
 
+def iter_headers(path: str) -> Iterator[str]:
+    """Yield FASTA header lines (without the leading '>').
+
+    The file is memory-mapped and searched for newline + '>' boundaries, so
+    sequence lines are skipped at memory speed instead of being decoded one
+    by one.
+    """
+    with open(path, "rb") as fin:
+        if os.fstat(fin.fileno()).st_size == 0:
+            return
+        with mmap.mmap(fin.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            if mm[:1] == b">":
+                start = 0
+            else:
+                start = mm.find(b"\n>")
+                if start < 0:
+                    return
+                start += 1
+            while True:
+                end = mm.find(b"\n", start)
+                if end < 0:
+                    end = len(mm)
+                yield mm[start + 1 : end].decode(errors="replace")
+                start = mm.find(b"\n>", end)
+                if start < 0:
+                    return
+                start += 1
+
+
 def main() -> None:
     ap = argparse.ArgumentParser(description="Generate seqid2taxid map for Centrifuge/Ganon.")
     ap.add_argument("--fasta", required=True, help="Reference FASTA file.")
@@ -47,24 +90,27 @@ def main() -> None:
 
     missing = 0
     total = 0
-    with open(args.fasta, "r") as fin, open(args.out, "w") as fout:
-        for line in fin:
-            if not line.startswith(">"):
-                continue
+    pending: List[str] = []
+    with open(args.out, "w") as fout:
+        for header in iter_headers(args.fasta):
             total += 1
-            header = line[1:].strip()
+            header = header.strip()
             seq_id = header.split()[0]
             tax = lookup(seq_id)
             if not tax:
-                tokens = re.split(r"[\\s\\|,;]+", header)
+                tokens = TOKEN_SPLIT_RE.split(header)
                 for tok in tokens:
                     tax = lookup(tok)
                     if tax:
                         break
             if tax:
-                fout.write(f"{seq_id}\t{tax}\n")
+                pending.append(f"{seq_id}\t{tax}\n")
+                if len(pending) >= 10000:
+                    fout.writelines(pending)
+                    pending.clear()
             else:
                 missing += 1
+        fout.writelines(pending)
 
     print(f"[INFO] seqid2taxid: mapped {total - missing} / {total} sequences (missing {missing}).")
 
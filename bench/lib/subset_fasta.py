@@ -11,25 +11,47 @@ from __future__ import annotations
 
 import argparse
 from pathlib import Path
+from typing import Iterator, Tuple
 
 
-def iter_fasta(path: Path):
-    name = None
-    seq_lines = []
-    with path.open("r", encoding="utf-8", errors="ignore") as handle:
-        for line in handle:
-            line = line.rstrip("\n")
-            if not line:
-                continue
-            if line.startswith(">"):
-                if name is not None:
-                    yield name, "".join(seq_lines)
-                name = line
-                seq_lines = []
+def iter_fasta(path: Path, block_size: int = 1 << 22) -> Iterator[Tuple[bytes, bytes]]:
+    """Yield ``(header, sequence)`` byte strings; headers keep their '>'.
+
+    The file is read in large binary blocks and split on newline + '>'
+    boundaries, so each record is handled as one bytes object rather than
+    line by line.
+    """
+    # A leading newline lets a header on the very first line be found by the
+    # same boundary search; the first split piece (preamble) is always dropped.
+    buf = bytearray(b"\n")
+    with path.open("rb") as handle:
+        while True:
+            block = handle.read(block_size)
+            if block:
+                buf += block
+                # Only the new bytes (plus one for a split "\n>") need searching;
+                # rescanning the whole buffer is quadratic on long records.
+                cut = buf.rfind(b"\n>", max(0, len(buf) - len(block) - 1))
+                if cut <= 0:
+                    continue
             else:
-                seq_lines.append(line)
-        if name is not None:
-            yield name, "".join(seq_lines)
+                cut = len(buf)
+            chunk = bytes(buf[:cut])
+            del buf[:cut]
+            for record in chunk.split(b"\n>")[1:]:
+                header, _, body = record.partition(b"\n")
+                # translate() drops line breaks in one C pass; deleting both
+                # '\r' and '\n' matches universal-newline reading.
+                yield b">" + header.rstrip(b"\r"), body.translate(None, b"\r\n")
+            if not block:
+                break
+
+
+def format_record(header: bytes, seq: bytes, width: int = 80) -> bytes:
+    """Render one wrapped FASTA record as a single bytes object."""
+    lines = [header]
+    lines.extend(seq[i : i + width] for i in range(0, len(seq), width))
+    return b"\n".join(lines) + b"\n"
 
 
 def main() -> None:
@@ -59,15 +81,13 @@ def main() -> None:
     emitted_seqs = 0
     emitted_bases = 0
 
-    with out.open("w", encoding="utf-8") as handle:
+    with out.open("wb") as handle:
         for header, seq in iter_fasta(inp):
             if emitted_seqs >= args.max_seqs or emitted_bases >= args.max_bases:
                 break
             remaining_bases = args.max_bases - emitted_bases
             subseq = seq if len(seq) <= remaining_bases else seq[:remaining_bases]
-            handle.write(f"{header}\n")
-            for i in range(0, len(subseq), 80):
-                handle.write(subseq[i : i + 80] + "\n")
+            handle.write(format_record(header, subseq))
             emitted_seqs += 1
             emitted_bases += len(subseq)
             if len(subseq) < len(seq):
@@ -6,10 +6,20 @@ from __future__ import annotations
 import argparse
 import csv
 import os
-from collections import defaultdict
 from pathlib import Path
 
+import numpy as np
+import pandas as pd
+
 RANK_ORDER = ["superkingdom", "phylum", "class", "order", "family", "genus", "species"]
+KEY_COLUMNS = ["sample", "tool", "rank"]
+SUMMARY_METRICS = ["L1_total_variation_pctpts", "BrayCurtis_pct", "F1_%"]
+CONTIG_METRICS = ["n", "accuracy_percent"]
+RUNTIME_FIELDS = ["stage", "tool", "user_seconds", "sys_seconds", "max_rss_gb"]
+
+# Bound by ensure_matplotlib() so the script can report on missing data
+# without importing matplotlib at all.
+plt = None
 
 
 def load_table(path: Path, key_cols):
@@ -24,33 +34,62 @@ def load_table(path: Path, key_cols):
     return data
 
 
-def load_rows(path: Path):
-    if not path.is_file():
-        return []
-    with path.open(newline="") as handle:
-        return list(csv.DictReader(handle, delimiter="\t"))
-
-
-def load_runtime_rows(path: Path):
-    if not path.is_file():
-        return []
-    with path.open(newline="") as handle:
-        return list(csv.DictReader(handle, delimiter="\t"))
-
-
-def safe_float(value: str) -> float:
-    try:
-        return float(value)
-    except (TypeError, ValueError):
-        return 0.0
+def load_metrics_df(path: Path, metrics) -> pd.DataFrame:
+    """Read only the key columns and ``metrics`` of an aggregate TSV.
+
+    Key columns become categoricals; empty or non-numeric metric cells become
+    0.0.
+    """
+    if not path.is_file() or path.stat().st_size == 0:
+        return pd.DataFrame()
+    wanted = set(KEY_COLUMNS).union(metrics)
+    df = pd.read_csv(
+        path,
+        sep="\t",
+        usecols=lambda col: col in wanted,
+        dtype=str,
+        keep_default_na=False,
+    )
+    for col in KEY_COLUMNS:
+        if col in df.columns:
+            df[col] = df[col].fillna("").astype("category")
+    for col in metrics:
+        df[col] = pd.to_numeric(df[col], errors="coerce").fillna(0.0) if col in df.columns else 0.0
+    return df
+
+
+def load_runtime_df(path: Path) -> pd.DataFrame:
+    """Read ``RUNTIME_FIELDS`` of the runtime log; unparseable numbers become 0.0."""
+    if not path.is_file() or path.stat().st_size == 0:
+        return pd.DataFrame(columns=RUNTIME_FIELDS)
+    df = pd.read_csv(
+        path,
+        sep="\t",
+        usecols=lambda col: col in RUNTIME_FIELDS,
+        dtype=str,
+        keep_default_na=False,
+    )
+    for col in RUNTIME_FIELDS:
+        if col not in df.columns:
+            df[col] = ""
+    df[["stage", "tool"]] = df[["stage", "tool"]].fillna("")
+    for col in ("user_seconds", "sys_seconds", "max_rss_gb"):
+        df[col] = pd.to_numeric(df[col], errors="coerce").fillna(0.0)
+    return df
 
 
 def ensure_matplotlib():
+    """Import matplotlib with the Agg backend and bind the module-level ``plt``."""
+    global plt
+    if plt is not None:
+        return
     try:
         import matplotlib
 
         matplotlib.use("Agg")
-        import matplotlib.pyplot as plt  # noqa: F401
+        matplotlib.rcParams["path.simplify"] = True
+        matplotlib.rcParams["agg.path.chunksize"] = 10000
+        import matplotlib.pyplot as plt
         try:
             plt.style.use("seaborn-v0_8-colorblind")
         except Exception:
@@ -60,22 +99,60 @@ def ensure_matplotlib():
 
 
 def order_ranks(ranks):
-    ranks = list(ranks)
-    ordered = [rank for rank in RANK_ORDER if rank in ranks]
-    extras = [rank for rank in ranks if rank not in RANK_ORDER]
-    return ordered + sorted(extras)
+    present = set(ranks)
+    ordered = [rank for rank in RANK_ORDER if rank in present]
+    return ordered + sorted(present.difference(RANK_ORDER))
 
 
 def get_tool_colors(tools):
-    import matplotlib.pyplot as plt
-
+    """Map each tool to a plain RGBA tuple, sampling tab10 in a single call."""
     cmap = plt.get_cmap("tab10")
-    return {tool: cmap(i % cmap.N) for i, tool in enumerate(tools)}
-
-
-def mean(values):
-    values = [v for v in values if v is not None]
-    return sum(values) / len(values) if values else 0.0
+    rgba = cmap(np.arange(len(tools)) % cmap.N).tolist()
+    return {tool: tuple(color) for tool, color in zip(tools, rgba)}
+
+
+def _arrange(means: pd.Series, order, tool_colors) -> pd.DataFrame:
+    """Unstack a (key, tool) mean series into a key x tool matrix in plot order."""
+    mat = means.unstack(fill_value=0.0)
+    present = set(mat.columns)
+    tools = [tool for tool in tool_colors if tool in present]
+    return mat.reindex(index=order(mat.index), columns=tools, fill_value=0.0)
+
+
+def build_aggregates(summary_df: pd.DataFrame, contig_df: pd.DataFrame, tool_colors):
+    """Compute every plotted mean matrix up front, one groupby per grouping.
+
+    Matrices are indexed by rank (or sample) in plot order, with one column
+    per tool present; empty cells are 0.0.
+    """
+    by_rank = summary_df.groupby(["rank", "tool"], observed=True)[SUMMARY_METRICS].mean()
+    by_sample = summary_df.groupby(["sample", "tool"], observed=True)["F1_%"].mean()
+    aggregates = {
+        "f1_by_rank": _arrange(by_rank["F1_%"], order_ranks, tool_colors),
+        "l1_by_rank": _arrange(by_rank["L1_total_variation_pctpts"], order_ranks, tool_colors),
+        "bray_by_rank": _arrange(by_rank["BrayCurtis_pct"], order_ranks, tool_colors),
+        "f1_by_sample": _arrange(by_sample, sorted, tool_colors),
+        "accuracy_by_rank": None,
+    }
+    if not contig_df.empty:
+        contig_df = contig_df[contig_df["n"] > 0]
+        if not contig_df.empty:
+            accuracy = contig_df.groupby(["rank", "tool"], observed=True)["accuracy_percent"].mean()
+            aggregates["accuracy_by_rank"] = _arrange(accuracy, order_ranks, tool_colors)
+    return aggregates
+
+
+def reset_figure(fig, size, ncols: int = 1, **kwargs):
+    """Clear the shared figure, resize it and return fresh axes."""
+    fig.clf()
+    fig.set_size_inches(*size)
+    return fig.subplots(1, ncols, **kwargs)
+
+
+def save_figure(fig, out_path: Path):
+    fig.tight_layout()
+    # A fast zlib level: PNGs come out ~10% larger but encode noticeably quicker.
+    fig.savefig(out_path, pil_kwargs={"compress_level": 1})
 
 
 def clean_axis(ax):
@@ -84,124 +161,74 @@ def clean_axis(ax):
         ax.spines[spine].set_visible(False)
 
 
-def plot_f1_by_rank(summary_rows, out_path: Path, tool_colors):
-    import matplotlib.pyplot as plt
+def plot_f1_by_rank(fig, mat: pd.DataFrame, out_path: Path, tool_colors):
+    ranks = list(mat.index)
+    tools = list(mat.columns)
 
-    data = defaultdict(lambda: defaultdict(list))
-    for row in summary_rows:
-        tool = row["tool"]
-        rank = row["rank"]
-        data[rank][tool].append(safe_float(row.get("F1_%")))
-
-    ranks = order_ranks(data.keys())
-    tools = [tool for tool in tool_colors if any(tool in rank_data for rank_data in data.values())]
-
-    fig, ax = plt.subplots(figsize=(11, 5.5))
+    ax = reset_figure(fig, (11, 5.5))
     width = 0.8 / max(1, len(tools))
-    x = list(range(len(ranks)))
+    x = np.arange(len(ranks))
     for idx, tool in enumerate(tools):
-        offsets = [xi + idx * width for xi in x]
-        means = [mean(data[rank].get(tool, [])) for rank in ranks]
-        ax.bar(offsets, means, width=width, label=tool, color=tool_colors.get(tool))
+        ax.bar(x + idx * width, mat[tool].to_numpy(), width=width, label=tool, color=tool_colors.get(tool))
 
-    ax.set_xticks([xi + width * (len(tools) - 1) / 2 for xi in x])
+    ax.set_xticks(x + width * (len(tools) - 1) / 2)
     ax.set_xticklabels(ranks, rotation=20)
     ax.set_ylabel("F1 (%)")
     ax.set_title("Mean F1 by Rank")
     ax.legend(frameon=False, fontsize=9, ncol=min(len(tools), 4))
     ax.set_ylim(0, 100)
     clean_axis(ax)
-    fig.tight_layout()
-    fig.savefig(out_path)
-    plt.close(fig)
-
-
-def plot_l1_bray(summary_rows, out_path: Path, tool_colors):
-    import matplotlib.pyplot as plt
+    save_figure(fig, out_path)
 
-    tool_metrics = defaultdict(lambda: {"L1": defaultdict(list), "Bray": defaultdict(list)})
-    for row in summary_rows:
-        tool = row["tool"]
-        rank = row["rank"]
-        tool_metrics[tool]["L1"][rank].append(safe_float(row.get("L1_total_variation_pctpts")))
-        tool_metrics[tool]["Bray"][rank].append(safe_float(row.get("BrayCurtis_pct")))
 
-    tools = [tool for tool in tool_colors if tool in tool_metrics]
-    ranks = order_ranks({rank for tm in tool_metrics.values() for rank in tm["L1"].keys()})
+def plot_l1_bray(fig, l1_mat: pd.DataFrame, bray_mat: pd.DataFrame, out_path: Path, tool_colors):
+    ranks = list(l1_mat.index)
+    tools = list(l1_mat.columns)
 
-    fig, axes = plt.subplots(1, 2, figsize=(12, 5.5), sharey=True)
-    for ax, metric_key, label in zip(axes, ["L1", "Bray"], ["L1 Total Variation (pct-pts)", "Bray-Curtis (%)"]):
+    axes = reset_figure(fig, (12, 5.5), ncols=2, sharey=True)
+    for ax, mat, label in zip(axes, [l1_mat, bray_mat], ["L1 Total Variation (pct-pts)", "Bray-Curtis (%)"]):
         for tool in tools:
-            means = [mean(tool_metrics[tool][metric_key].get(rank, [])) for rank in ranks]
-            ax.plot(ranks, means, marker="o", linewidth=2, label=tool, color=tool_colors.get(tool))
+            ax.plot(ranks, mat[tool].to_numpy(), marker="o", linewidth=2, label=tool, color=tool_colors.get(tool))
         ax.set_title(label)
         ax.set_xticks(range(len(ranks)))
         ax.set_xticklabels(ranks, rotation=25)
         clean_axis(ax)
     axes[0].set_ylabel("Mean Value")
     axes[1].legend(frameon=False, fontsize=9, ncol=min(len(tools), 3))
-    fig.tight_layout()
-    fig.savefig(out_path)
-    plt.close(fig)
-
-
-def plot_accuracy(contig_rows, out_path: Path, tool_colors):
-    import matplotlib.pyplot as plt
+    save_figure(fig, out_path)
 
-    data = defaultdict(lambda: defaultdict(list))
-    for row in contig_rows:
-        if safe_float(row.get("n")) <= 0:
-            continue
-        tool = row["tool"]
-        rank = row["rank"]
-        data[rank][tool].append(safe_float(row.get("accuracy_percent")))
 
-    if not data:
-        return
-
-    ranks = order_ranks(data.keys())
-    tools = [tool for tool in tool_colors if any(tool in rank_data for rank_data in data.values())]
+def plot_accuracy(fig, mat: pd.DataFrame, out_path: Path, tool_colors):
+    ranks = list(mat.index)
+    tools = list(mat.columns)
 
-    fig, ax = plt.subplots(figsize=(11, 5.5))
+    ax = reset_figure(fig, (11, 5.5))
     width = 0.8 / max(1, len(tools))
-    x = list(range(len(ranks)))
+    x = np.arange(len(ranks))
     for idx, tool in enumerate(tools):
-        offsets = [xi + idx * width for xi in x]
-        means = [mean(data[rank].get(tool, [])) for rank in ranks]
-        ax.bar(offsets, means, width=width, label=tool, color=tool_colors.get(tool))
+        ax.bar(x + idx * width, mat[tool].to_numpy(), width=width, label=tool, color=tool_colors.get(tool))
 
-    ax.set_xticks([xi + width * (len(tools) - 1) / 2 for xi in x])
+    ax.set_xticks(x + width * (len(tools) - 1) / 2)
     ax.set_xticklabels(ranks, rotation=20)
     ax.set_ylabel("Contig Accuracy (%)")
     ax.set_title("Mean Contig Accuracy by Rank")
     ax.legend(frameon=False, fontsize=9, ncol=min(len(tools), 4))
     ax.set_ylim(0, 100)
     clean_axis(ax)
-    fig.tight_layout()
-    fig.savefig(out_path)
-    plt.close(fig)
+    save_figure(fig, out_path)
 
 
-def plot_per_sample_stack(summary_rows, out_path: Path, tool_colors):
-    import matplotlib.pyplot as plt
+def plot_per_sample_stack(fig, mat: pd.DataFrame, out_path: Path, tool_colors):
+    samples = list(mat.index)
+    tools = list(mat.columns)
 
-    samples = sorted({row["sample"] for row in summary_rows})
-    tools = [tool for tool in tool_colors if any(row["tool"] == tool for row in summary_rows)]
-
-    data = {sample: defaultdict(list) for sample in samples}
-    for row in summary_rows:
-        data[row["sample"]][row["tool"]].append(safe_float(row.get("F1_%")))
-
-    fig, ax = plt.subplots(figsize=(12, 5.5))
-    bottoms = [0.0] * len(samples)
-    x = list(range(len(samples)))
+    ax = reset_figure(fig, (12, 5.5))
+    bottoms = np.zeros(len(samples))
+    x = np.arange(len(samples))
     for tool in tools:
-        heights = []
-        for sample in samples:
-            values = data[sample].get(tool, [])
-            heights.append(mean(values))
+        heights = mat[tool].to_numpy()
         ax.bar(x, heights, bottom=bottoms, label=tool, color=tool_colors.get(tool))
-        bottoms = [b + h for b, h in zip(bottoms, heights)]
+        bottoms = bottoms + heights
 
     ax.set_xticks(x)
     ax.set_xticklabels(samples, rotation=25)
@@ -209,47 +236,30 @@ def plot_per_sample_stack(summary_rows, out_path: Path, tool_colors):
     ax.set_title("Per-sample stacked F1 scores")
     ax.legend(frameon=False, fontsize=9, ncol=min(len(tools), 4))
     clean_axis(ax)
-    fig.tight_layout()
-    fig.savefig(out_path)
-    plt.close(fig)
-
-
-def summarise_runtime(runtime_rows):
-    data = defaultdict(lambda: {"cpu_sec": [], "max_gb": []})
-    for row in runtime_rows:
-        if row.get("stage") != "run":
-            continue
-        tool = row.get("tool")
-        if not tool:
-            continue
-        try:
-            user = float(row.get("user_seconds", 0.0))
-        except ValueError:
-            user = 0.0
-        try:
-            sys_time = float(row.get("sys_seconds", 0.0))
-        except ValueError:
-            sys_time = 0.0
-        try:
-            rss = float(row.get("max_rss_gb", 0.0))
-        except ValueError:
-            rss = 0.0
-        data[tool]["cpu_sec"].append(user + sys_time)
-        data[tool]["max_gb"].append(rss)
-    summary = {}
-    for tool, metrics in data.items():
-        cpu_vals = [v for v in metrics["cpu_sec"] if v >= 0]
-        mem_vals = [v for v in metrics["max_gb"] if v >= 0]
-        summary[tool] = {
-            "cpu_min": mean(cpu_vals) / 60.0 if cpu_vals else 0.0,
-            "max_gb": max(mem_vals) if mem_vals else 0.0,
-        }
-    return summary
+    save_figure(fig, out_path)
+
 
+def summarise_runtime(runtime_df: pd.DataFrame):
+    run = runtime_df[(runtime_df["stage"] == "run") & (runtime_df["tool"] != "")]
+    if run.empty:
+        return {}
+    cpu = run["user_seconds"] + run["sys_seconds"]
+    # Negative readings are ignored: they drop out of the CPU mean and can
+    # never beat the 0.0 floor of the peak.
+    per_tool = pd.DataFrame(
+        {
+            "tool": run["tool"],
+            "cpu": cpu.where(cpu >= 0),
+            "rss": run["max_rss_gb"].clip(lower=0.0),
+        }
+    ).groupby("tool", sort=False).agg(cpu_sec=("cpu", "mean"), max_gb=("rss", "max"))
+    return {
+        tool: {"cpu_min": 0.0 if pd.isna(cpu_sec) else cpu_sec / 60.0, "max_gb": float(max_gb)}
+        for tool, cpu_sec, max_gb in per_tool.itertuples()
+    }
 
-def plot_runtime(summary, out_path: Path, tool_colors):
-    import matplotlib.pyplot as plt
 
+def plot_runtime(fig, summary, out_path: Path, tool_colors):
     if not summary:
         return
 
@@ -257,7 +267,7 @@ def plot_runtime(summary, out_path: Path, tool_colors):
     values = [summary[t]["cpu_min"] for t in tools]
     x = list(range(len(tools)))
 
-    fig, ax = plt.subplots(figsize=(10, 5))
+    ax = reset_figure(fig, (10, 5))
     bars = ax.bar(x, values, color=[tool_colors.get(t) for t in tools])
     ax.set_ylabel("CPU time (minutes)")
     ax.set_title("Mean CPU time per tool (run stage)")
@@ -266,14 +276,10 @@ def plot_runtime(summary, out_path: Path, tool_colors):
     clean_axis(ax)
     for bar, val in zip(bars, values):
         ax.text(bar.get_x() + bar.get_width() / 2, bar.get_height(), f"{val:.1f}", ha="center", va="bottom", fontsize=8)
-    fig.tight_layout()
-    fig.savefig(out_path)
-    plt.close(fig)
-
+    save_figure(fig, out_path)
 
-def plot_memory(summary, out_path: Path, tool_colors):
-    import matplotlib.pyplot as plt
 
+def plot_memory(fig, summary, out_path: Path, tool_colors):
     if not summary:
         return
 
@@ -281,7 +287,7 @@ def plot_memory(summary, out_path: Path, tool_colors):
     values = [summary[t]["max_gb"] for t in tools]
     x = list(range(len(tools)))
 
-    fig, ax = plt.subplots(figsize=(10, 5))
+    ax = reset_figure(fig, (10, 5))
     bars = ax.bar(x, values, color=[tool_colors.get(t) for t in tools])
     ax.set_ylabel("Peak RSS (GB)")
     ax.set_title("Peak memory per tool (run stage)")
@@ -290,9 +296,7 @@ def plot_memory(summary, out_path: Path, tool_colors):
     clean_axis(ax)
     for bar, val in zip(bars, values):
         ax.text(bar.get_x() + bar.get_width() / 2, bar.get_height(), f"{val:.1f}", ha="center", va="bottom", fontsize=8)
-    fig.tight_layout()
-    fig.savefig(out_path)
-    plt.close(fig)
+    save_figure(fig, out_path)
 
 
 def main() -> None:
@@ -308,31 +312,38 @@ def main() -> None:
     summary_path = out_root / "summary_per_tool_per_sample.tsv"
     contig_path = out_root / "contig_accuracy_per_tool.tsv"
 
-    summary_rows = load_rows(summary_path)
-    contig_rows = load_rows(contig_path)
-    runtime_rows = load_runtime_rows(out_root / "runtime_memory.tsv")
-    if not summary_rows:
+    summary_df = load_metrics_df(summary_path, SUMMARY_METRICS)
+    contig_df = load_metrics_df(contig_path, CONTIG_METRICS)
+    runtime_df = load_runtime_df(out_root / "runtime_memory.tsv")
+    if summary_df.empty:
         print("[plot] No summary data available; skipping figure generation.")
         return
 
     ensure_matplotlib()
 
-    tools = sorted({row["tool"] for row in summary_rows})
-    if contig_rows:
-        tools = sorted(set(tools).union({row["tool"] for row in contig_rows}))
-    tool_colors = get_tool_colors(tools)
+    tools = set(summary_df["tool"])
+    if not contig_df.empty:
+        tools.update(contig_df["tool"])
+    tool_colors = get_tool_colors(sorted(tools))
 
-    plot_f1_by_rank(summary_rows, out_root / "fig_f1_by_rank.png", tool_colors)
-    plot_l1_bray(summary_rows, out_root / "fig_l1_braycurtis.png", tool_colors)
-    if contig_rows:
-        plot_accuracy(contig_rows, out_root / "fig_accuracy_by_rank.png", tool_colors)
-    plot_per_sample_stack(summary_rows, out_root / "fig_per_sample_f1_stack.png", tool_colors)
-
-    runtime_summary = summarise_runtime(runtime_rows)
-    if runtime_summary:
-        plot_runtime(runtime_summary, out_root / "fig_cpu_time_by_tool.png", tool_colors)
-        plot_memory(runtime_summary, out_root / "fig_peak_memory_by_tool.png", tool_colors)
+    aggregates = build_aggregates(summary_df, contig_df, tool_colors)
+    runtime_summary = summarise_runtime(runtime_df)
 
+    # One Figure is cleared and resized for each plot rather than rebuilt.
+    fig = plt.figure()
+    try:
+        plot_f1_by_rank(fig, aggregates["f1_by_rank"], out_root / "fig_f1_by_rank.png", tool_colors)
+        plot_l1_bray(
+            fig, aggregates["l1_by_rank"], aggregates["bray_by_rank"], out_root / "fig_l1_braycurtis.png", tool_colors
+        )
+        if aggregates["accuracy_by_rank"] is not None:
+            plot_accuracy(fig, aggregates["accuracy_by_rank"], out_root / "fig_accuracy_by_rank.png", tool_colors)
+        plot_per_sample_stack(fig, aggregates["f1_by_sample"], out_root / "fig_per_sample_f1_stack.png", tool_colors)
+        if runtime_summary:
+            plot_runtime(fig, runtime_summary, out_root / "fig_cpu_time_by_tool.png", tool_colors)
+            plot_memory(fig, runtime_summary, out_root / "fig_peak_memory_by_tool.png", tool_colors)
+    finally:
+        plt.close(fig)
 
 if __name__ == "__main__":
     main()
@@ -12,9 +12,12 @@ highest rank are meaningful again.
 from __future__ import annotations
 
 import argparse
-import csv
+import os
+import shutil
+import sys
+from collections import defaultdict
 from pathlib import Path
-from typing import Dict, List, Tuple
+from typing import DefaultDict, Dict, List, Tuple
 
 RANK_PRIORITY = [
     "phylum",
@@ -24,6 +27,7 @@ RANK_PRIORITY = [
     "genus",
     "species",
 ]
+RANK_PRIORITY_INDEX = {rank: idx for idx, rank in enumerate(RANK_PRIORITY)}
 
 CANONICAL_SUPERKINGDOMS = {
     "2",      # Bacteria
@@ -34,17 +38,34 @@ CANONICAL_SUPERKINGDOMS = {
 }
 
 
-def load_taxonomy(path: Path) -> Dict[str, Tuple[str, str, str]]:
-    """Return mapping TaxID -> (parent, rank, name)."""
-    taxonomy: Dict[str, Tuple[str, str, str]] = {}
+def load_taxonomy(path: Path) -> Tuple[Dict[str, Tuple[str, str]], Dict[str, str]]:
+    """Return mappings TaxID -> (parent, rank) and TaxID -> name.
+
+    Names are only needed for the rebuilt superkingdom rows, so they live in
+    their own dict; taxids and ranks are interned since they repeat heavily.
+    """
+    taxonomy: Dict[str, Tuple[str, str]] = {}
+    names: Dict[str, str] = {}
     with path.open() as handle:
-        reader = csv.DictReader(handle, delimiter="\t")
-        for row in reader:
-            taxonomy[row["TaxID"]] = (row["ParentTaxID"], row["Rank"].lower(), row["Name"])
-    return taxonomy
+        header = handle.readline().rstrip("\n").split("\t")
+        try:
+            tax_col, parent_col, rank_col, name_col = (
+                header.index(col) for col in ("TaxID", "ParentTaxID", "Rank", "Name")
+            )
+        except ValueError as exc:
+            raise SystemExit(f"{path}: missing taxonomy column ({exc})") from exc
+        width = max(tax_col, parent_col, rank_col, name_col) + 1
+        for line in handle:
+            parts = line.rstrip("\n").split("\t")
+            if len(parts) < width:
+                continue
+            taxid = sys.intern(parts[tax_col])
+            taxonomy[taxid] = (sys.intern(parts[parent_col]), sys.intern(parts[rank_col].lower()))
+            names[taxid] = parts[name_col]
+    return taxonomy, names
 
 
-def canonical_superkingdom(taxid: str, taxonomy: Dict[str, Tuple[str, str, str]]) -> str:
+def canonical_superkingdom(taxid: str, taxonomy: Dict[str, Tuple[str, str]]) -> str:
     """Ascend the taxonomy tree to the canonical superkingdom/domain identifier."""
     current = taxid
     visited = set()
@@ -52,14 +73,14 @@ def canonical_superkingdom(taxid: str, taxonomy: Dict[str, Tuple[str, str, str]]
         visited.add(current)
         if current in CANONICAL_SUPERKINGDOMS:
             return current
-        parent, rank, _ = taxonomy.get(current, ("", "", ""))
+        parent, _ = taxonomy.get(current, ("", ""))
         if not parent or parent == current:
             break
         current = parent
     return taxid
 
 
-def align_to_targets(taxid: str, targets: set[str], taxonomy: Dict[str, Tuple[str, str, str]]) -> str | None:
+def align_to_targets(taxid: str, targets: set[str], taxonomy: Dict[str, Tuple[str, str]]) -> str | None:
     """Ascend until a taxid present in the target set is found."""
     current = taxid
     visited = set()
@@ -67,13 +88,65 @@ def align_to_targets(taxid: str, targets: set[str], taxonomy: Dict[str, Tuple[st
         visited.add(current)
         if current in targets:
             return current
-        parent, _, _ = taxonomy.get(current, ("", "", ""))
+        parent, _ = taxonomy.get(current, ("", ""))
         if not parent or parent == current:
             break
         current = parent
     return None
 
 
+def resolve_superkingdom(
+    taxid: str,
+    targets: set[str],
+    taxonomy: Dict[str, Tuple[str, str]],
+    cache: Dict[str, Tuple[str | None, str | None]],
+) -> str:
+    """Return ``align_to_targets`` for ``taxid``, falling back to ``canonical_superkingdom``.
+
+    ``cache`` maps each taxid to its nearest (target, canonical) ancestor-or-self.
+    Every node passed on the way up is filled in, so later lookups stop at the
+    first already-resolved ancestor instead of walking to the root again.
+    """
+    path: List[str] = []
+    seen = set()
+    current = taxid
+    tail: Tuple[str | None, str | None] = (None, None)
+    while current:
+        if current in cache:
+            tail = cache[current]
+            break
+        if current in seen:
+            # Parent cycle: nearest hits depend on the entry point, so do not cache.
+            return align_to_targets(taxid, targets, taxonomy) or canonical_superkingdom(taxid, taxonomy)
+        seen.add(current)
+        path.append(current)
+        parent = taxonomy.get(current, ("", ""))[0]
+        if not parent or parent == current:
+            break
+        current = parent
+
+    target, canonical = tail
+    for node in reversed(path):
+        if node in targets:
+            target = node
+        if node in CANONICAL_SUPERKINGDOMS:
+            canonical = node
+        cache[node] = (target, canonical)
+    if taxid in cache:
+        target, canonical = cache[taxid]
+    return target or canonical or taxid
+
+
+def build_superkingdom_table(taxonomy: Dict[str, Tuple[str, str]], targets: set[str]) -> Dict[str, str]:
+    """Map every taxid in ``taxonomy`` to its resolved superkingdom in one sweep.
+
+    Taxids absent from the table resolve to themselves, so callers can use
+    ``table.get(taxid, taxid)``.
+    """
+    cache: Dict[str, Tuple[str | None, str | None]] = {}
+    return {taxid: resolve_superkingdom(taxid, targets, taxonomy, cache) for taxid in taxonomy}
+
+
 def load_truth_superkingdoms(path: Path) -> set[str]:
     targets: set[str] = set()
     with path.open() as handle:
@@ -86,51 +159,56 @@ def load_truth_superkingdoms(path: Path) -> set[str]:
     return targets
 
 
-def rewrite_profile(profile: Path, taxonomy: Dict[str, Tuple[str, str, str]], targets: set[str]) -> None:
-    lines: List[str] = []
-    with profile.open() as handle:
-        lines = handle.readlines()
-
-    if not lines:
-        return
-
+def rewrite_profile(
+    profile: Path,
+    names: Dict[str, str],
+    targets: set[str],
+    superkingdom_of: Dict[str, str],
+) -> None:
+    # First pass: tally abundance per (rank, superkingdom) so the aggregate
+    # rank can be chosen afterwards without keeping the body in memory. Ranks
+    # outside RANK_PRIORITY share one tally, used only when no priority rank
+    # is present (the old code then aggregated every row).
     header_prefixes = ("@", "#")
-    body: List[List[str]] = []
     header_lines: List[str] = []
-    for line in lines:
-        if line.startswith(header_prefixes):
-            header_lines.append(line)
-        else:
-            body.append(line.rstrip("\n").split("\t"))
-
-    if not body:
+    original_super: List[List[str]] = []
+    available_ranks: set[str] = set()
+    # Line numbers the second pass drops (headers are re-emitted up front).
+    skip_lines: set[int] = set()
+    rank_totals: DefaultDict[str, DefaultDict[str, float]] = defaultdict(lambda: defaultdict(float))
+    has_body = False
+    with profile.open() as handle:
+        for lineno, line in enumerate(handle):
+            if line.startswith(header_prefixes):
+                header_lines.append(line)
+                skip_lines.add(lineno)
+                continue
+            has_body = True
+            row = line.rstrip("\n").split("\t", 5)
+            if len(row) < 2:
+                skip_lines.add(lineno)
+                continue
+            rank = row[1].lower()
+            if rank == "superkingdom":
+                original_super.append(line.rstrip("\n").split("\t"))
+                skip_lines.add(lineno)
+                continue
+            available_ranks.add(rank)
+            if len(row) < 5:
+                skip_lines.add(lineno)
+                continue
+            try:
+                perc = float(row[4])
+            except ValueError:
+                perc = 0.0
+            target = superkingdom_of.get(row[0], row[0])
+            rank_totals[rank if rank in RANK_PRIORITY_INDEX else ""][target] += perc
+
+    if not has_body:
         return
 
-    remainder: List[List[str]] = []
-    aggregates: Dict[str, float] = {}
-
-    original_super: List[List[str]] = [row for row in body if len(row) >= 2 and row[1].lower() == "superkingdom"]
-
-    available_ranks = {row[1].lower() for row in body if len(row) >= 2 and row[1].lower() != "superkingdom"}
-    aggregate_rank = next((rank for rank in RANK_PRIORITY if rank in available_ranks), None)
-
-    for row in body:
-        if len(row) < 5:
-            continue
-        taxid, rank = row[0], row[1].lower()
-        if rank == "superkingdom":
-            continue  # rebuild later
-        remainder.append(row)
-        if aggregate_rank and rank != aggregate_rank:
-            continue
-        try:
-            perc = float(row[4])
-        except ValueError:
-            perc = 0.0
-        target = align_to_targets(taxid, targets, taxonomy)
-        if not target:
-            target = canonical_superkingdom(taxid, taxonomy)
-        aggregates[target] = aggregates.get(target, 0.0) + perc
+    aggregate_rank = min(available_ranks & RANK_PRIORITY_INDEX.keys(), key=RANK_PRIORITY_INDEX.__getitem__, default=None)
+    aggregates = rank_totals.get(aggregate_rank or "", defaultdict(float))
 
     # Ensure targets exist in aggregates even if zero to avoid dropping strata
     for target in targets:
@@ -141,15 +219,15 @@ def rewrite_profile(profile: Path, taxonomy: Dict[str, Tuple[str, str, str]], ta
         for taxid, perc in sorted(aggregates.items()):
             if perc <= 0:
                 continue
-            parent, _, name = taxonomy.get(taxid, ("", "", ""))
+            name = names.get(taxid, "")
             width = 7
             path = [taxid] + ["NA"] * (width - 1)
-            names = [name or "NA"] + ["NA"] * (width - 1)
+            path_names = [name or "NA"] + ["NA"] * (width - 1)
             super_rows.append([
                 taxid,
                 "superkingdom",
                 "|".join(path),
-                "|".join(names),
+                "|".join(path_names),
                 f"{perc:.6f}",
             ])
         existing_keys = {row[0] for row in super_rows}
@@ -159,10 +237,18 @@ def rewrite_profile(profile: Path, taxonomy: Dict[str, Tuple[str, str, str]], ta
     else:
         super_rows = original_super
 
-    with profile.open("w") as handle:
-        handle.writelines(header_lines)
-        for row in super_rows + remainder:
-            handle.write("\t".join(row) + "\n")
+    # Second pass: stream the non-superkingdom rows into a sibling temp file
+    # and swap it in, so a failed rewrite never leaves a truncated profile.
+    tmp_path = profile.with_name(profile.name + ".tmp")
+    with profile.open() as src, tmp_path.open("w", buffering=1 << 20) as out:
+        out.writelines(header_lines)
+        out.writelines("\t".join(row) + "\n" for row in super_rows)
+        for lineno, line in enumerate(src):
+            if lineno in skip_lines:
+                continue
+            out.write(line if line.endswith("\n") else line + "\n")
+    shutil.copymode(profile, tmp_path)
+    os.replace(tmp_path, profile)
 
 
 def main() -> None:
@@ -192,11 +278,12 @@ def main() -> None:
     if not taxonomy_path.exists():
         raise SystemExit(f"taxonomy hierarchy not found: {taxonomy_path}")
 
-    taxonomy = load_taxonomy(taxonomy_path)
+    taxonomy, names = load_taxonomy(taxonomy_path)
     targets = load_truth_superkingdoms(truth_path)
     if not targets and not CANONICAL_SUPERKINGDOMS:
         raise SystemExit("no superkingdoms found in truth profile")
-    rewrite_profile(profile_path, taxonomy, targets or CANONICAL_SUPERKINGDOMS)
+    targets = targets or CANONICAL_SUPERKINGDOMS
+    rewrite_profile(profile_path, names, targets, build_superkingdom_table(taxonomy, targets))
 
 
 if __name__ == "__main__":
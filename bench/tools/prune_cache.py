@@ -11,13 +11,23 @@ contains hashed run subdirectories.
 from __future__ import annotations
 
 import argparse
+import heapq
+import json
 import os
 import pathlib
 import shutil
 import sys
 import time
+from concurrent.futures import ThreadPoolExecutor
 from dataclasses import dataclass
-from typing import Iterable, List
+from typing import Dict, Iterable, List, Tuple
+
+
+SIZE_MANIFEST = ".size_manifest.json"
+# Cached sizes are only trusted for trees left untouched this long, so a run
+# that is still appending to its files is always measured afresh.
+SIZE_CACHE_MIN_AGE = 3600.0
+REMOVE_WORKERS = 8
 
 
 @dataclass
@@ -76,65 +86,215 @@ def parse_args() -> argparse.Namespace:
 
 
 def compute_directory_size(path: pathlib.Path) -> int:
+    """Sum the sizes of all files below ``path``.
+
+    Walks with ``os.scandir`` so directory checks come from the readdir
+    d_type. Symlinked directories are not descended into, and symlinked
+    files count their target's size, as with the old ``os.walk`` version.
+    """
     total = 0
-    for root, _, files in os.walk(path):
-        for name in files:
-            try:
-                total += (pathlib.Path(root) / name).stat().st_size
-            except OSError:
-                continue
+
+    def _walk(dir_path: str) -> None:
+        nonlocal total
+        try:
+            it = os.scandir(dir_path)
+        except OSError:
+            return
+        with it:
+            for entry in it:
+                try:
+                    if entry.is_dir():
+                        if not entry.is_symlink():
+                            _walk(entry.path)
+                        continue
+                    total += entry.stat().st_size
+                except OSError:
+                    continue
+
+    _walk(os.fspath(path))
     return total
 
 
+def load_size_manifest(path: pathlib.Path) -> Dict[str, Dict[str, float]]:
+    try:
+        with path.open() as handle:
+            data = json.load(handle)
+    except (OSError, ValueError):
+        return {}
+    return data if isinstance(data, dict) else {}
+
+
+def write_size_manifest(path: pathlib.Path, manifest: Dict[str, Dict[str, float]]) -> None:
+    tmp_path = path.with_name(path.name + ".tmp")
+    try:
+        with tmp_path.open("w") as handle:
+            json.dump(manifest, handle, indent=1, sort_keys=True)
+        os.replace(tmp_path, path)
+    except OSError as exc:
+        print(f"[WARN] could not write size manifest {path}: {exc}", file=sys.stderr)
+
+
+def tree_fingerprint(path: pathlib.Path) -> Tuple[int, float]:
+    """Return ``(file_count, newest directory mtime)`` for the tree at ``path``.
+
+    Only directories are stat'ed: adding, removing or renaming a file anywhere
+    below ``path`` changes its parent directory's mtime, so this catches new
+    files in nested subdirectories without stat'ing every file.
+    """
+    file_count = 0
+    newest = 0.0
+
+    def _walk(dir_path: str) -> None:
+        nonlocal file_count, newest
+        try:
+            newest = max(newest, os.stat(dir_path).st_mtime)
+            it = os.scandir(dir_path)
+        except OSError:
+            return
+        with it:
+            for entry in it:
+                try:
+                    if entry.is_dir() and not entry.is_symlink():
+                        _walk(entry.path)
+                        continue
+                except OSError:
+                    pass
+                file_count += 1
+
+    _walk(os.fspath(path))
+    return file_count, newest
+
+
+def _scan_entry(entry: os.DirEntry, manifest: Dict[str, Dict[str, float]]) -> Tuple[CacheEntry, Dict[str, float]] | None:
+    try:
+        stat = entry.stat()
+    except OSError:
+        return None
+    path = pathlib.Path(entry.path)
+    file_count, newest = tree_fingerprint(path)
+    cached = manifest.get(entry.name)
+    if (
+        isinstance(cached, dict)
+        and "size" in cached
+        and cached.get("file_count") == file_count
+        and cached.get("newest_mtime") == newest
+        and time.time() - newest >= SIZE_CACHE_MIN_AGE
+    ):
+        size_bytes = int(cached["size"])
+    else:
+        size_bytes = compute_directory_size(path)
+    record = {"size": size_bytes, "file_count": file_count, "newest_mtime": newest}
+    return CacheEntry(path=path, size_bytes=size_bytes, mtime=stat.st_mtime), record
+
+
 def scan_cache(root: pathlib.Path) -> List[CacheEntry]:
-    entries: List[CacheEntry] = []
+    """Return one entry per run directory under ``root``.
+
+    Sizes are remembered in ``root/.size_manifest.json`` together with each
+    tree's file count and newest directory mtime. A size is reused only while
+    both match and the tree has been quiet for ``SIZE_CACHE_MIN_AGE``, so
+    finished runs are not re-walked but active ones always are.
+    """
     if not root.exists():
-        return entries
-    for entry in root.iterdir():
-        if not entry.is_dir():
-            continue
+        return []
+    with os.scandir(root) as it:
+        subdirs = [entry for entry in it if entry.is_dir()]
+    if not subdirs:
+        return []
+    manifest_path = root / SIZE_MANIFEST
+    manifest = load_size_manifest(manifest_path)
+    # Run directories are disjoint, so their walks can overlap freely; on
+    # network filesystems this hides most of the per-stat latency.
+    workers = min(len(subdirs), 32, (os.cpu_count() or 1) * 4)
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        scanned = [result for result in pool.map(lambda e: _scan_entry(e, manifest), subdirs) if result is not None]
+    entries = [entry for entry, _ in scanned]
+    updated = {entry.path.name: record for entry, record in scanned}
+    if updated != manifest:
+        write_size_manifest(manifest_path, updated)
+    return entries
+
+
+def _remove_path(path: str) -> None:
+    try:
+        if os.path.isdir(path) and not os.path.islink(path):
+            shutil.rmtree(path, ignore_errors=True)
+        else:
+            os.unlink(path)
+    except OSError:
+        pass
+
+
+def remove_entries(entries: List[CacheEntry], workers: int = REMOVE_WORKERS) -> None:
+    """Delete ``entries`` on a thread pool.
+
+    Every top-level child of every entry is its own task, so both separate
+    entries and the subtrees inside one large entry are unlinked in parallel;
+    the emptied entry directories are removed afterwards.
+    """
+    children: List[str] = []
+    for entry in entries:
         try:
-            stat = entry.stat()
+            with os.scandir(entry.path) as it:
+                children.extend(child.path for child in it)
         except OSError:
             continue
-        size_bytes = compute_directory_size(entry)
-        entries.append(CacheEntry(path=entry, size_bytes=size_bytes, mtime=stat.st_mtime))
-    return entries
+    if children:
+        with ThreadPoolExecutor(max_workers=min(workers, len(children))) as pool:
+            for _ in pool.map(_remove_path, children):
+                pass
+    for entry in entries:
+        shutil.rmtree(entry.path, ignore_errors=True)
 
 
-def remove_entry(entry: CacheEntry, dry_run: bool) -> None:
+def remove_entry(entry: CacheEntry, dry_run: bool, pending: List[CacheEntry] | None = None) -> None:
+    """Report and delete ``entry``; with ``pending``, queue it for ``remove_entries`` instead."""
     if dry_run:
         print(f"[dry-run] would remove {entry.path.name} ({entry.human_size()}, {entry.age_days:.1f} days old)")
         return
     print(f"Removing {entry.path.name} ({entry.human_size()}, {entry.age_days:.1f} days old)")
-    shutil.rmtree(entry.path, ignore_errors=True)
+    if pending is not None:
+        pending.append(entry)
+    else:
+        shutil.rmtree(entry.path, ignore_errors=True)
 
 
-def prune_by_age(entries: Iterable[CacheEntry], max_age_days: float, dry_run: bool) -> List[CacheEntry]:
+def prune_by_age(
+    entries: Iterable[CacheEntry],
+    max_age_days: float,
+    dry_run: bool,
+    pending: List[CacheEntry] | None = None,
+) -> List[CacheEntry]:
     remaining: List[CacheEntry] = []
     for entry in entries:
         if entry.age_days > max_age_days:
-            remove_entry(entry, dry_run)
+            remove_entry(entry, dry_run, pending)
         else:
             remaining.append(entry)
     return remaining
 
 
-def prune_by_size(entries: List[CacheEntry], max_size_gb: float, dry_run: bool) -> None:
+def prune_by_size(
+    entries: List[CacheEntry],
+    max_size_gb: float,
+    dry_run: bool,
+    pending: List[CacheEntry] | None = None,
+) -> None:
     if max_size_gb is None or max_size_gb <= 0:
         return
     limit_bytes = max_size_gb * (1024 ** 3)
-    # Sort by most recent modification (newest last) so we remove oldest first.
-    entries.sort(key=lambda e: e.mtime)  # oldest first
     total = sum(e.size_bytes for e in entries)
     if total <= limit_bytes:
         print(f"Cache size {total / (1024 ** 3):.2f} GiB within limit {max_size_gb:.2f} GiB")
         return
     print(f"Cache size {total / (1024 ** 3):.2f} GiB exceeds limit {max_size_gb:.2f} GiB → pruning oldest entries")
-    for entry in list(entries):
-        if total <= limit_bytes:
-            break
-        remove_entry(entry, dry_run)
+    # Min-heap on mtime: only the entries actually evicted get popped. The
+    # index breaks ties in listing order, as the old stable sort did.
+    heap = [(entry.mtime, idx, entry) for idx, entry in enumerate(entries)]
+    heapq.heapify(heap)
+    while heap and total > limit_bytes:
+        _, _, entry = heapq.heappop(heap)
+        remove_entry(entry, dry_run, pending)
         total -= entry.size_bytes
 
 
@@ -159,10 +319,14 @@ def main() -> int:
                 f"{entry.path.name}\t{entry.human_size()}\t{entry.age_days:.1f} days"
             )
 
+    # Entries are only reported while pruning; deletion happens in one
+    # parallel batch at the end.
+    pending: List[CacheEntry] = []
     if args.max_age_days is not None and args.max_age_days >= 0:
-        entries = prune_by_age(entries, args.max_age_days, args.dry_run)
+        entries = prune_by_age(entries, args.max_age_days, args.dry_run, pending)
 
-    prune_by_size(entries, args.max_size_gb, args.dry_run)
+    prune_by_size(entries, args.max_size_gb, args.dry_run, pending)
+    remove_entries(pending)
     return 0
 
 
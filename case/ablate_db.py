@@ -9,6 +9,7 @@ from __future__ import annotations
 
 import argparse
 import csv
+import os
 import random
 from pathlib import Path
 from typing import Dict, Iterable, List, Set, Tuple
@@ -51,42 +52,139 @@ def group_sequences_by_taxa(mapping: Dict[str, str], targets: Set[str]) -> Dict[
     return grouped
 
 
-def determine_removals(grouped: Dict[str, List[str]], level: float, rng: random.Random) -> Set[str]:
+def sample_removal_orders(grouped: Dict[str, List[str]], rng: random.Random) -> Dict[str, List[str]]:
+    """Draw one random removal order per taxid (taxids visited in sorted order)."""
+    return {taxid: rng.sample(seqs, len(seqs)) for taxid, seqs in sorted(grouped.items())}
+
+
+def removal_counts(sizes: Dict[str, int], level: float) -> Dict[str, int]:
+    """Number of sequences to drop per taxid at ``level``: ``round(level * n)``."""
+    return {taxid: min(int(round(level * size, 0)), size) for taxid, size in sizes.items()}
+
+
+def determine_removals(orders: Dict[str, List[str]], counts: Dict[str, int]) -> Set[str]:
+    """Remove the first ``counts[taxid]`` sequences of each taxid's order.
+
+    Every level slices the same orders, so removal sets are nested: anything
+    dropped at 0.25 is also dropped at 0.5.
+    """
     to_remove: Set[str] = set()
-    for taxid, seqs in grouped.items():
-        if not seqs:
-            continue
-        count = int(round(level * len(seqs), 0))
-        if count <= 0:
-            continue
-        choices = rng.sample(seqs, min(count, len(seqs)))
-        to_remove.update(choices)
+    for taxid, seqs in orders.items():
+        count = counts.get(taxid, 0)
+        if count > 0:
+            to_remove.update(seqs[:count])
     return to_remove
 
 
+def _next_header(data: bytes, pos: int) -> int:
+    """Offset of the first header line after ``pos`` in ``data``, or -1."""
+    nxt = data.find(b"\n>", pos)
+    return nxt + 1 if nxt >= 0 else -1
+
+
+def index_fasta(fasta_path: Path, block_size: int = 1 << 22) -> List[Tuple[bytes | None, int, int]]:
+    """Return ``(seq_id, start, end)`` byte ranges for every record in ``fasta_path``.
+
+    Text before the first header becomes a ``None`` record, which is always
+    kept. The file is scanned once in large binary blocks; only header lines
+    are parsed.
+    """
+    records: List[Tuple[bytes | None, int, int]] = []
+    buf = bytearray()
+    base = 0  # file offset of buf[0]
+    current: bytes | None = None
+    start = 0
+    with fasta_path.open("rb") as fin:
+        while True:
+            block = fin.read(block_size)
+            if block:
+                # Whatever is left in ``buf`` holds no newline, so only the new
+                # block needs searching.
+                nl = block.rfind(b"\n")
+                prev = len(buf)
+                buf += block
+                if nl < 0:
+                    continue
+                cut = prev + nl + 1
+            else:
+                cut = len(buf)
+            data = bytes(buf[:cut])
+            del buf[:cut]
+            # ``data`` always starts at a line start, so a header is either at
+            # offset 0 or right after a newline.
+            pos = 0 if data.startswith(b">") else _next_header(data, 0)
+            while pos >= 0:
+                offset = base + pos
+                if offset > start or current is not None:
+                    records.append((current, start, offset))
+                eol = data.find(b"\n", pos)
+                fields = data[pos + 1 : eol if eol >= 0 else len(data)].split(None, 1)
+                current = fields[0] if fields else b""
+                start = offset
+                pos = _next_header(data, pos)
+            base += len(data)
+            if not block:
+                break
+    if base > start or current is not None:
+        records.append((current, start, base))
+    return records
+
+
+def _copy_range(src_fd: int, dst_fd: int, offset: int, length: int) -> None:
+    """Append ``length`` bytes from ``src_fd`` at ``offset`` to ``dst_fd``."""
+    try:
+        while length > 0:
+            copied = os.copy_file_range(src_fd, dst_fd, length, offset)
+            if copied == 0:
+                return
+            offset += copied
+            length -= copied
+    except (AttributeError, OSError):
+        # No in-kernel copy (old kernel/Python or cross-filesystem): fall back
+        # to pread/write from wherever copy_file_range stopped.
+        pass
+    while length > 0:
+        chunk = os.pread(src_fd, min(length, 1 << 22), offset)
+        if not chunk:
+            return
+        os.write(dst_fd, chunk)
+        offset += len(chunk)
+        length -= len(chunk)
+
+
 def write_ablated_fasta(
     fasta_path: Path,
     out_path: Path,
     removal_set: Set[str],
+    records: List[Tuple[bytes | None, int, int]] | None = None,
 ) -> Tuple[int, int]:
+    """Copy ``fasta_path`` to ``out_path`` without the records in ``removal_set``.
+
+    ``records`` is the ``index_fasta`` result; pass it in when writing several
+    levels so the input is scanned only once. Kept records are copied as
+    contiguous byte ranges.
+    """
+    if records is None:
+        records = index_fasta(fasta_path)
+    removal = {seq_id.encode() for seq_id in removal_set}
     total = 0
     removed = 0
     out_path.parent.mkdir(parents=True, exist_ok=True)
-    with fasta_path.open() as fin, out_path.open("w") as fout:
-        keep = True
-        current_id = None
-        for line in fin:
-            if line.startswith(">"):
+    with fasta_path.open("rb", buffering=0) as fin, out_path.open("wb", buffering=0) as fout:
+        src_fd, dst_fd = fin.fileno(), fout.fileno()
+        run_start = run_end = 0
+        for seq_id, start, end in records:
+            if seq_id is not None:
                 total += 1
-                current_id = line[1:].strip().split()[0]
-                keep = current_id not in removal_set
-                if not keep:
+                if seq_id in removal:
                     removed += 1
-                else:
-                    fout.write(line)
-            else:
-                if keep:
-                    fout.write(line)
+                    continue
+            # Merge adjacent kept records into one copy.
+            if start != run_end:
+                _copy_range(src_fd, dst_fd, run_start, run_end - run_start)
+                run_start = start
+            run_end = end
+        _copy_range(src_fd, dst_fd, run_start, run_end - run_start)
     return total, removed
 
 
@@ -117,26 +215,32 @@ def main() -> None:
 
     mapping = load_seqmap(seqmap_path)
     grouped = group_sequences_by_taxa(mapping, targets)
-    rng = random.Random(args.seed)
+    sizes = {taxid: len(seqs) for taxid, seqs in grouped.items()}
+    orders = sample_removal_orders(grouped, random.Random(args.seed))
+    records = index_fasta(fasta_path)
 
     summary_path = out_dir / "ablation_summary.tsv"
     out_dir.mkdir(parents=True, exist_ok=True)
-    if not summary_path.exists():
-        with summary_path.open("w") as summary:
-            summary.write("level_fraction\tlevel_label\ttarget_taxid\ttotal_sequences\tdropped_sequences\n")
+    write_header = not summary_path.exists()
 
-    for level in levels:
-        label = f"{int(level*100):03d}"
-        removal_set = determine_removals(grouped, level, rng)
-        out_path = out_dir / f"{args.prefix}.ablate{label}.fasta"
-        total, removed = write_ablated_fasta(fasta_path, out_path, removal_set)
-
-        with summary_path.open("a") as summary:
-            for taxid, seqs in grouped.items():
-                count = int(round(level * len(seqs), 0))
-                summary.write(f"{level}\t{label}\t{taxid}\t{len(seqs)}\t{min(count, len(seqs))}\n")
-
-        print(f"[ablate] level={level:.2f} ({label}) → wrote {out_path.name} (removed {removed}/{total} sequences)")
+    with summary_path.open("a", buffering=1 << 20) as summary:
+        if write_header:
+            summary.write("level_fraction\tlevel_label\ttarget_taxid\ttotal_sequences\tdropped_sequences\n")
+        for level in levels:
+            label = f"{int(level*100):03d}"
+            counts = removal_counts(sizes, level)
+            removal_set = determine_removals(orders, counts)
+            out_path = out_dir / f"{args.prefix}.ablate{label}.fasta"
+            total, removed = write_ablated_fasta(fasta_path, out_path, removal_set, records)
+
+            summary.write(
+                "".join(
+                    f"{level}\t{label}\t{taxid}\t{size}\t{counts[taxid]}\n"
+                    for taxid, size in sizes.items()
+                )
+            )
+
+            print(f"[ablate] level={level:.2f} ({label}) → wrote {out_path.name} (removed {removed}/{total} sequences)")
 
 
 if __name__ == "__main__":
@@ -7,9 +7,15 @@ import argparse
 from pathlib import Path
 from typing import Dict, List
 
+import matplotlib
+
+matplotlib.use("Agg")  # headless: skip interactive backend detection
+
 import matplotlib.pyplot as plt
 import pandas as pd
 
+DPI = 200
+
 
 def load_summary(path: Path) -> pd.DataFrame:
     df = pd.read_csv(path, sep="\t")
@@ -18,68 +24,70 @@ def load_summary(path: Path) -> pd.DataFrame:
     return df
 
 
-def plot_rank_fallback(df: pd.DataFrame, out_path: Path) -> None:
-    plt.figure(figsize=(8, 4.5))
-    x = df["level_fraction"]
-    plt.plot(x, df["assigned_species_pct"], marker="o", label="Species")
-    plt.plot(x, df["assigned_genus_pct"], marker="o", label="≤ Genus")
-    plt.plot(x, df["assigned_family_pct"], marker="o", label="≤ Family")
-    plt.plot(x, df["assigned_higher_pct"], marker="o", label="Higher ranks")
-    plt.xlabel("Fraction of dominant taxa removed")
-    plt.ylabel("Assignments retained (%)")
-    plt.title("Rank fallback under database ablation")
-    plt.legend()
-    plt.grid(True, linestyle="--", alpha=0.4)
+def reset_figure(fig, size):
+    """Clear the shared figure, resize it and return a fresh axes."""
+    fig.clf()
+    fig.set_size_inches(*size)
+    return fig.add_subplot()
+
+
+def save_figure(fig, out_path: Path) -> None:
+    fig.tight_layout()
     out_path.parent.mkdir(parents=True, exist_ok=True)
-    plt.tight_layout()
-    plt.savefig(out_path, dpi=200)
-    plt.close()
+    fig.savefig(out_path, dpi=DPI)
 
 
-def plot_rank_stack(df: pd.DataFrame, out_path: Path) -> None:
-    plt.figure(figsize=(8, 4.5))
+def plot_rank_fallback(fig, df: pd.DataFrame, out_path: Path) -> None:
+    ax = reset_figure(fig, (8, 4.5))
+    x = df["level_fraction"]
+    ax.plot(x, df["assigned_species_pct"], marker="o", label="Species")
+    ax.plot(x, df["assigned_genus_pct"], marker="o", label="≤ Genus")
+    ax.plot(x, df["assigned_family_pct"], marker="o", label="≤ Family")
+    ax.plot(x, df["assigned_higher_pct"], marker="o", label="Higher ranks")
+    ax.set_xlabel("Fraction of dominant taxa removed")
+    ax.set_ylabel("Assignments retained (%)")
+    ax.set_title("Rank fallback under database ablation")
+    ax.legend()
+    ax.grid(True, linestyle="--", alpha=0.4)
+    save_figure(fig, out_path)
+
+
+def plot_rank_stack(fig, df: pd.DataFrame, out_path: Path) -> None:
+    ax = reset_figure(fig, (8, 4.5))
     levels = df["level_label"].astype(str)
     species = df["assigned_species_pct"]
     genus = df["assigned_genus_pct"] - df["assigned_species_pct"]
     family = df["assigned_family_pct"] - df["assigned_genus_pct"]
     higher = df["assigned_higher_pct"]
-    bottom = species
-    plt.bar(levels, species, label="Species")
-    plt.bar(levels, genus, bottom=species, label="Genus (fallback)")
-    plt.bar(levels, family, bottom=species + genus, label="Family (fallback)")
-    plt.bar(levels, higher, bottom=species + genus + family, label="Higher ranks")
-    plt.xlabel("Ablation level (%)")
-    plt.ylabel("Assignments (%)")
-    plt.title("Assignment distribution by rank")
-    plt.legend()
-    plt.tight_layout()
-    out_path.parent.mkdir(parents=True, exist_ok=True)
-    plt.savefig(out_path, dpi=200)
-    plt.close()
-
-
-def plot_eval_metrics(df: pd.DataFrame, out_path: Path) -> None:
+    ax.bar(levels, species, label="Species")
+    ax.bar(levels, genus, bottom=species, label="Genus (fallback)")
+    ax.bar(levels, family, bottom=species + genus, label="Family (fallback)")
+    ax.bar(levels, higher, bottom=species + genus + family, label="Higher ranks")
+    ax.set_xlabel("Ablation level (%)")
+    ax.set_ylabel("Assignments (%)")
+    ax.set_title("Assignment distribution by rank")
+    ax.legend()
+    save_figure(fig, out_path)
+
+
+def plot_eval_metrics(fig, df: pd.DataFrame, out_path: Path) -> None:
     if df.empty:
         return
     ranks = ["species", "genus", "family", "order", "class", "phylum", "superkingdom"]
-    plt.figure(figsize=(9, 5))
+    ax = reset_figure(fig, (9, 5))
     for rank in ranks:
         subset = df[df["rank"] == rank]
         if subset.empty:
             continue
-        plt.plot(subset["level_fraction"], subset["F1"].astype(float), marker="o", label=rank.title())
-    if plt.gca().has_data():
-        plt.xlabel("Fraction of dominant taxa removed")
-        plt.ylabel("F1 score (%)")
-        plt.title("F1 by rank under database ablation")
-        plt.legend()
-        plt.grid(True, linestyle="--", alpha=0.4)
-        plt.tight_layout()
-        out_path.parent.mkdir(parents=True, exist_ok=True)
-        plt.savefig(out_path, dpi=200)
-        plt.close()
-    else:
-        plt.close()
+        ax.plot(subset["level_fraction"], subset["F1"].astype(float), marker="o", label=rank.title())
+    if not ax.has_data():
+        return
+    ax.set_xlabel("Fraction of dominant taxa removed")
+    ax.set_ylabel("F1 score (%)")
+    ax.set_title("F1 by rank under database ablation")
+    ax.legend()
+    ax.grid(True, linestyle="--", alpha=0.4)
+    save_figure(fig, out_path)
 
 
 def main() -> None:
@@ -95,12 +103,17 @@ def main() -> None:
     outdir.mkdir(parents=True, exist_ok=True)
 
     df = load_summary(summary_path)
-    plot_rank_fallback(df, outdir / "fig_ablation_rank_fallback.png")
-    plot_rank_stack(df, outdir / "fig_ablation_rank_stack.png")
-
-    if eval_path and eval_path.is_file():
-        eval_df = pd.read_csv(eval_path, sep="\t")
-        plot_eval_metrics(eval_df, outdir / "fig_ablation_f1_by_rank.png")
+    # One figure is cleared and reused for every plot.
+    fig = plt.figure()
+    try:
+        plot_rank_fallback(fig, df, outdir / "fig_ablation_rank_fallback.png")
+        plot_rank_stack(fig, df, outdir / "fig_ablation_rank_stack.png")
+
+        if eval_path and eval_path.is_file():
+            eval_df = pd.read_csv(eval_path, sep="\t")
+            plot_eval_metrics(fig, eval_df, outdir / "fig_ablation_f1_by_rank.png")
+    finally:
+        plt.close(fig)
 
 
 if __name__ == "__main__":
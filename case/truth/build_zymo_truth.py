@@ -21,21 +21,23 @@ import argparse
 import csv
 import math
 import subprocess
+import sys
 from collections import Counter, defaultdict
 from pathlib import Path
 from typing import Dict, Iterable, List, Optional, Tuple
 
 RANKS = ["superkingdom", "phylum", "class", "order", "family", "genus", "species"]
+RANK_ORDER = {rank: idx for idx, rank in enumerate(RANKS)}
+FASTA_WHITESPACE = (b"\n", b"\r", b" ", b"\t", b"\x0b", b"\x0c")
 
 
 def load_seqmap(path: Path) -> Dict[str, int]:
     mapping: Dict[str, int] = {}
-    with path.open() as fh:
-        for line in fh:
-            if not line.strip():
+    with path.open(newline="") as fh:
+        for row in csv.reader(fh, delimiter="\t", quoting=csv.QUOTE_NONE):
+            if len(row) < 2 or not row[0].strip():
                 continue
-            seqid, taxid = line.strip().split("\t")[:2]
-            mapping[seqid] = int(taxid)
+            mapping[row[0].strip()] = int(row[1])
     return mapping
 
 
@@ -44,47 +46,85 @@ def load_nodes(path: Path) -> Tuple[Dict[int, int], Dict[int, str]]:
     rank: Dict[int, str] = {}
     with path.open() as fh:
         for line in fh:
-            parts = [p.strip() for p in line.split("|")]
+            # nodes.dmp fields are separated by "\t|\t"; only the first three
+            # are needed, so the rest of the line is never split.
+            parts = line.split("\t|\t", 3)
             if len(parts) < 3:
                 continue
             tid = int(parts[0])
             parent[tid] = int(parts[1])
-            rank[tid] = parts[2]
+            rank[tid] = sys.intern(parts[2].rstrip("\t|\r\n"))
     return parent, rank
 
 
-def climb_to_rank(taxid: int, target_rank: str, parent: Dict[int, int], rank: Dict[int, str]) -> Optional[int]:
+def climb_to_rank(
+    taxid: int,
+    target_rank: str,
+    parent: Dict[int, int],
+    rank: Dict[int, str],
+    cache: Optional[Dict[Tuple[int, str], Optional[int]]] = None,
+) -> Optional[int]:
+    """Return the ancestor-or-self of ``taxid`` at ``target_rank``, or None.
+
+    With ``cache``, every node passed on the way up is recorded as well (they
+    all share the answer), so repeated climbs become a dict lookup.
+    """
+    if cache is not None and (taxid, target_rank) in cache:
+        return cache[(taxid, target_rank)]
     seen = set()
+    path: List[int] = []
     current = taxid
+    found: Optional[int] = None
     while current not in seen:
+        if cache is not None and (current, target_rank) in cache:
+            found = cache[(current, target_rank)]
+            break
         seen.add(current)
+        path.append(current)
         if rank.get(current) == target_rank:
-            return current
+            found = current
+            break
         nxt = parent.get(current)
         if nxt is None or nxt == current:
-            return None
+            break
         current = nxt
-    return None
+    if cache is not None:
+        for node in path:
+            cache[(node, target_rank)] = found
+    return found
 
 
-def load_contig_lengths(path: Path) -> Dict[str, int]:
+def load_contig_lengths(path: Path, block_size: int = 1 << 23) -> Dict[str, int]:
+    """Return contig id -> sequence length.
+
+    The FASTA is read in 8 MiB binary blocks split on header boundaries; each
+    record body is measured with ``bytes.count`` so sequence lines are never
+    visited in Python. Whitespace (line breaks, ``\\r``) is not counted.
+    """
     lengths: Dict[str, int] = {}
-    with path.open() as fh:
-        current = None
-        acc = 0
-        for line in fh:
-            line = line.strip()
-            if not line:
-                continue
-            if line.startswith(">"):
-                if current is not None:
-                    lengths[current] = acc
-                current = line[1:].split()[0]
-                acc = 0
+    # The leading newline lets a header on the first line match b"\n>".
+    buf = bytearray(b"\n")
+    with path.open("rb") as fh:
+        while True:
+            block = fh.read(block_size)
+            if block:
+                buf += block
+                # Only the new bytes (plus one for a split "\n>") need searching.
+                cut = buf.rfind(b"\n>", max(0, len(buf) - len(block) - 1))
+                if cut <= 0:
+                    continue
             else:
-                acc += len(line)
-        if current is not None:
-            lengths[current] = acc
+                cut = len(buf)
+            chunk = bytes(buf[:cut])
+            del buf[:cut]
+            for record in chunk.split(b"\n>")[1:]:
+                header, _, body = record.partition(b"\n")
+                fields = header.split(None, 1)
+                if not fields:
+                    continue
+                lengths[fields[0].decode()] = len(body) - sum(body.count(ch) for ch in FASTA_WHITESPACE)
+            if not block:
+                break
     return lengths
 
 
@@ -100,34 +140,32 @@ def parse_paf(
         for line in fh:
             if not line or line.startswith("#"):
                 continue
-            parts = line.strip().split("\t")
+            # Split off the 12 fixed columns only; optional tags stay one string.
+            parts = line.strip().split("\t", 12)
             if len(parts) < 12:
                 continue
-            query = parts[0]
-            qlen = int(parts[1])
-            qstart = int(parts[2])
-            qend = int(parts[3])
-            target = parts[5]
+            # Cheapest rejections first: most alignments fail on length or target.
             match = int(parts[9])
             block = int(parts[10])
-            mapq = int(parts[11])
             if match < min_match or block <= 0:
                 continue
-            dv = None
-            for tag in parts[12:]:
-                if tag.startswith("dv:f:"):
-                    dv = float(tag.split(":", 2)[2])
-                    break
-            identity = 1.0 - dv if dv is not None else match / block
-            if identity < min_identity:
+            taxid = seq2tax.get(parts[5])
+            if taxid is None:
                 continue
-            cov = (qend - qstart) / qlen if qlen > 0 else 0.0
+            qlen = int(parts[1])
+            cov = (int(parts[3]) - int(parts[2])) / qlen if qlen > 0 else 0.0
             if cov < min_coverage:
                 continue
-            taxid = seq2tax.get(target)
-            if taxid is None:
+            identity = match / block
+            if len(parts) > 12:
+                tags = "\t" + parts[12]
+                pos = tags.find("\tdv:f:")
+                if pos >= 0:
+                    stop = tags.find("\t", pos + 1)
+                    identity = 1.0 - float(tags[pos + 6 : stop if stop >= 0 else None])
+            if identity < min_identity:
                 continue
-            hits[query].append((taxid, target, match, identity, cov))
+            hits[parts[0]].append((taxid, parts[5], match, identity, cov))
     return hits
 
 
@@ -138,6 +176,7 @@ def assign_taxids(
     tolerance: float,
 ) -> Dict[str, Tuple[int, str, int, float, float]]:
     assignments: Dict[str, Tuple[int, str, int, float, float]] = {}
+    climb_cache: Dict[Tuple[int, str], Optional[int]] = {}
     for contig, rows in hits.items():
         if not rows:
             continue
@@ -153,7 +192,7 @@ def assign_taxids(
         else:
             genus_taxids = set()
             for taxid in species_taxids:
-                genus = climb_to_rank(taxid, "genus", parent, rank)
+                genus = climb_to_rank(taxid, "genus", parent, rank, climb_cache)
                 if genus:
                     genus_taxids.add(genus)
             if len(genus_taxids) == 1:
@@ -166,10 +205,22 @@ def assign_taxids(
     return assignments
 
 
-def taxonkit_paths(taxids: Iterable[int], taxdb: Path) -> Dict[int, Tuple[str, str]]:
-    taxids = sorted({tid for tid in taxids if tid})
+def taxonkit_paths(
+    taxids: Iterable[int],
+    taxdb: Path,
+    cache: Optional[Dict[int, Optional[Tuple[str, str]]]] = None,
+) -> Dict[int, Tuple[str, str]]:
+    """Return taxid -> (names, ids) lineages from ``taxonkit reformat``.
+
+    With ``cache``, only taxids not seen before are sent to taxonkit; misses
+    are remembered as None so they are not looked up again.
+    """
+    wanted = {tid for tid in taxids if tid}
+    if cache is None:
+        cache = {}
+    taxids = sorted(wanted.difference(cache))
     if not taxids:
-        return {}
+        return {tid: cache[tid] for tid in wanted if cache[tid] is not None}
     cmd = [
         "taxonkit",
         "reformat",
@@ -182,19 +233,42 @@ def taxonkit_paths(taxids: Iterable[int], taxdb: Path) -> Dict[int, Tuple[str, s
         "-t",
     ]
     proc = subprocess.run(cmd, input="\n".join(map(str, taxids)) + "\n", text=True, capture_output=True, check=True)
-    mapping: Dict[int, Tuple[str, str]] = {}
+    cache.update(dict.fromkeys(taxids))
     for line in proc.stdout.splitlines():
         parts = line.strip().split("\t")
         if len(parts) >= 3:
             tid = int(parts[0])
-            mapping[tid] = (parts[1], parts[2])
-    return mapping
+            cache[tid] = (parts[1], parts[2])
+    return {tid: cache[tid] for tid in wanted if cache[tid] is not None}
+
+
+def ancestor_paths(tax_paths: Dict[int, Tuple[str, str]]) -> Dict[int, Tuple[str, str]]:
+    """Derive (names, ids) for ancestors named in ``tax_paths`` but not keyed in it.
+
+    ``taxonkit reformat`` leaves the ranks below a taxon empty, so an
+    ancestor's lineage is its descendant's lineage cut after the ancestor's
+    rank; no second taxonkit run is needed.
+    """
+    derived: Dict[int, Tuple[str, str]] = {}
+    for names, ids in tax_paths.values():
+        name_list = names.split("|")
+        id_list = ids.split("|")
+        for idx, tid in enumerate(id_list):
+            if not tid or tid == "NA":
+                continue
+            tid_int = int(tid)
+            if tid_int in tax_paths or tid_int in derived:
+                continue
+            blank = [""] * (len(id_list) - idx - 1)
+            derived[tid_int] = ("|".join(name_list[: idx + 1] + blank), "|".join(id_list[: idx + 1] + blank))
+    return derived
 
 
 def build_profile(
     assignments: Dict[str, Tuple[int, str, int, float, float]],
     lengths: Dict[str, int],
     taxdb: Path,
+    path_cache: Optional[Dict[int, Optional[Tuple[str, str]]]] = None,
 ) -> List[Tuple[str, str, str, str, float]]:
     totals = Counter()  # rank -> total length
     accum: Dict[str, Counter] = {rank: Counter() for rank in RANKS}
@@ -204,16 +278,8 @@ def build_profile(
         if length <= 0:
             continue
         needed_taxids.add(taxid)
-    tax_paths = taxonkit_paths(needed_taxids, taxdb)
-
-    # Expand to include ancestor taxids from paths
-    ancestor_taxids: set[int] = set()
-    for names_ids in tax_paths.values():
-        _, ids = names_ids
-        for tid in ids.split("|"):
-            if tid and tid != "NA":
-                ancestor_taxids.add(int(tid))
-    tax_paths.update(taxonkit_paths(ancestor_taxids - set(tax_paths), taxdb))
+    tax_paths = taxonkit_paths(needed_taxids, taxdb, path_cache)
+    tax_paths.update(ancestor_paths(tax_paths))
 
     for contig, (taxid, _, _, _, _) in assignments.items():
         length = lengths.get(contig, 1)
@@ -282,7 +348,9 @@ def main() -> None:
     print(f"[truth] Assigned {len(assignments)} contigs ({assigned_species} species-level, {assigned_genus} genus-level)")
 
     taxdb = Path(args.taxonomy_dir)
-    tax_paths = taxonkit_paths({tid for tid, *_ in assignments.values()}, taxdb)
+    # One taxonkit run for every assigned taxid; build_profile reuses it.
+    path_cache: Dict[int, Optional[Tuple[str, str]]] = {}
+    taxonkit_paths({tid for tid, *_ in assignments.values()}, taxdb, path_cache)
 
     # Write per-contig truth table
     with open(args.out_contigs, "w", newline="") as out:
@@ -292,13 +360,13 @@ def main() -> None:
             writer.writerow([contig, taxid, assigned_rank, match, f"{ident:.2f}", f"{cov:.2f}"])
 
     # Build profile (length-weighted)
-    profile_rows = build_profile(assignments, lengths, taxdb)
+    profile_rows = build_profile(assignments, lengths, taxdb, path_cache)
     with open(args.out_profile, "w") as out:
         out.write("#CAMI Submission for Taxonomic Profiling\n")
         out.write("@Version:0.9.1 @Ranks:superkingdom|phylum|class|order|family|genus|species @SampleID:zymo_mc_truth\n")
         out.write("@@TAXID RANK TAXPATH TAXPATHSN PERCENTAGE\n")
         ALT_SUPERKINGDOM = {"Bacteria": 3379134}
-        for tid, rank_name, ids, names, pct in sorted(profile_rows, key=lambda x: (RANKS.index(x[1]), -x[4])):
+        for tid, rank_name, ids, names, pct in sorted(profile_rows, key=lambda x: (RANK_ORDER[x[1]], -x[4])):
             write_tid = str(tid)
             if rank_name == "superkingdom":
                 first_name = names.split("|")[0] if names else ""
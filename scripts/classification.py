@@ -3,7 +3,7 @@ import os
 import csv
 from collections import defaultdict
 import argparse
-from multiprocessing import Pool
+import multiprocessing
 import logging
 import sys
 
@@ -11,12 +11,30 @@ csv.field_size_limit(sys.maxsize)
 
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 
+RANKS = [
+    'superkingdom', 'phylum', 'class', 'order',
+    'family', 'genus', 'species', 'strain'
+]
+_RANK_IDX = {rank: i for i, rank in enumerate(RANKS)}
+
+# --- globals for worker processes ---
+_TAXONOMY = None            # dict: identifier -> taxid
+_HIERARCHY = None           # dict: taxid -> lineage string
+_REF_ABUNDANCE = None       # dict: ref_id -> count
+
+def _init_worker(taxonomy, taxonomy_hierarchy, ref_abundance):
+    global _TAXONOMY, _HIERARCHY, _REF_ABUNDANCE
+    _TAXONOMY = taxonomy
+    _HIERARCHY = taxonomy_hierarchy
+    _REF_ABUNDANCE = ref_abundance
+
 def load_taxonomy_file(taxonomy_file):
     taxonomy = {}
     with open(taxonomy_file, "r") as f:
         reader = csv.DictReader(f, delimiter="\t")
         for row in reader:
-            taxid = row["TaxID"]
+            # every identifier of this row maps to the same interned taxid
+            taxid = sys.intern(row["TaxID"])
             for identifier in row["Identifiers"].split(";"):
                 cleaned_id = identifier.strip()
                 if cleaned_id:
@@ -29,7 +47,7 @@ def load_taxonomy_hierarchy_file(taxonomy_hierarchy_file):
     with open(taxonomy_hierarchy_file, "r") as f:
         reader = csv.DictReader(f, delimiter="\t")
         for row in reader:
-            taxid = row["TaxID"]
+            taxid = sys.intern(row["TaxID"])
             hierarchy[taxid] = row["Lineage"].strip()
     logging.info(f"Loaded {len(hierarchy)} taxonomy hierarchies")
     return hierarchy
@@ -40,13 +58,15 @@ def parse_paf_file(paf_file):
     
     with open(paf_file, "r") as f:
         for line in f:
-            parts = line.strip().split("\t")
+            # CIGAR/tag columns past the alignment length are never read
+            parts = line.strip().split("\t", 11)
             if len(parts) < 11:
                 continue
                 
             query_id = parts[0]
             query_len = int(parts[1])
-            ref_id = parts[5]
+            # ref_id keys ref_counts and is stored in every hit tuple
+            ref_id = sys.intern(parts[5])
             align_len = int(parts[10])
             
             coverage = align_len / query_len if query_len > 0 else 0
@@ -59,26 +79,17 @@ def parse_paf_file(paf_file):
     return query_map, ref_counts
 
 def determine_taxonomic_level(lineage):
-    rank_order = [
-        'superkingdom', 'phylum', 'class', 'order',
-        'family', 'genus', 'species', 'strain'
-    ]
-    
-    current_level = None
+    current_index = -1
+    last = len(RANKS) - 1
     for part in lineage.split(';'):
-        part = part.strip()
-        if ':' in part:
-            rank, name = part.split(':', 1)
-            rank = rank.strip().lower()
-            if rank in rank_order:
-                if current_level is None:
-                    current_level = rank
-                else:
-                    current_index = rank_order.index(current_level)
-                    new_index = rank_order.index(rank)
-                    if new_index > current_index:
-                        current_level = rank
-    return current_level if current_level is not None else 'root'
+        rank, sep, _ = part.partition(':')
+        if sep:
+            index = _RANK_IDX.get(rank.strip().lower(), -1)
+            if index > current_index:
+                current_index = index
+                if current_index == last:
+                    break
+    return RANKS[current_index] if current_index >= 0 else 'root'
 
 def calculate_weighted_lineage(refs, ref_abundance, taxonomy):
     taxid_weights = defaultdict(float)
@@ -99,29 +110,30 @@ def determine_lca(taxid_weights, total_weight, taxonomy_hierarchy):
     if total_weight == 0:
         return "Unknown", "root", 0.0
 
+    # Index each lineage by rank once (first "rank:" part wins) instead of
+    # rescanning its parts for every rank.
     lineages = []
     for taxid, weight in taxid_weights.items():
         if taxid in taxonomy_hierarchy:
-            lineage = taxonomy_hierarchy[taxid].split(";")
-            lineages.append((lineage, weight/total_weight))
+            by_rank = {}
+            for part in taxonomy_hierarchy[taxid].split(";"):
+                rank, sep, _ = part.partition(":")
+                if sep:
+                    by_rank.setdefault(rank, part)
+            lineages.append((by_rank, weight/total_weight))
 
     if not lineages:
         return "Unknown", "root", 0.0
 
     consensus = {}
     confidence = 1.0
-    rank_order = [
-        'superkingdom', 'phylum', 'class', 'order',
-        'family', 'genus', 'species', 'strain'
-    ]
 
-    for rank in rank_order:
+    for rank in RANKS:
         level_counts = defaultdict(float)
-        for lineage, weight in lineages:
-            for part in lineage:
-                if part.startswith(f"{rank}:"):
-                    level_counts[part] += weight
-                    break
+        for by_rank, weight in lineages:
+            part = by_rank.get(rank)
+            if part is not None:
+                level_counts[part] += weight
         
         if level_counts:
             best_match, conf = max(level_counts.items(), key=lambda x: x[1])
@@ -130,7 +142,7 @@ def determine_lca(taxid_weights, total_weight, taxonomy_hierarchy):
         else:
             break  # Stop at first missing rank
 
-    lineage_parts = [consensus.get(rank) for rank in rank_order if consensus.get(rank)]
+    lineage_parts = [consensus.get(rank) for rank in RANKS if consensus.get(rank)]
     if not lineage_parts:
         return "Unknown", "root", 0.0
 
@@ -138,8 +150,11 @@ def determine_lca(taxid_weights, total_weight, taxonomy_hierarchy):
     level = determine_taxonomic_level(full_lineage)
     return full_lineage, level, min(confidence, 1.0)
 
-def process_query(args):
-    query, refs, ref_abundance, taxonomy, taxonomy_hierarchy = args
+def process_query(task):
+    # The maps are installed once per worker by _init_worker rather than
+    # pickled into every task.
+    query, refs = task
+    taxonomy, taxonomy_hierarchy = _TAXONOMY, _HIERARCHY
     
     # Check for exact matches first
     exact_matches = [ref for ref, _, is_exact in refs if is_exact and ref in taxonomy]
@@ -151,35 +166,54 @@ def process_query(args):
             return (query, lineage, level, 1.0)
 
     # Calculate LCA for non-exact matches
-    taxid_weights, total_weight = calculate_weighted_lineage(refs, ref_abundance, taxonomy)
+    taxid_weights, total_weight = calculate_weighted_lineage(refs, _REF_ABUNDANCE, taxonomy)
     lineage, level, confidence = determine_lca(taxid_weights, total_weight, taxonomy_hierarchy)
     
     return (query, lineage, level, confidence)
 
+def _quote_field(value):
+    # Rows used to go through csv.writer; hierarchy lineages are written
+    # verbatim and may hold quotes, so keep its minimal quoting for them.
+    if '"' in value or '\t' in value or '\r' in value or '\n' in value:
+        return '"' + value.replace('"', '""') + '"'
+    return value
+
+def _pool_context():
+    # With fork, _init_worker receives the parent's taxonomy dicts as-is;
+    # other start methods would pickle them once per worker.
+    if 'fork' in multiprocessing.get_all_start_methods():
+        return multiprocessing.get_context('fork')
+    return multiprocessing.get_context()
+
 def main_process(paf_file, taxonomy_file, hierarchy_file, output_file, processes=4):
     taxonomy = load_taxonomy_file(taxonomy_file)
     taxonomy_hierarchy = load_taxonomy_hierarchy_file(hierarchy_file)
     query_map, ref_abundance = parse_paf_file(paf_file)
 
-    tasks = [(query, refs, ref_abundance, taxonomy, taxonomy_hierarchy) 
-             for query, refs in query_map.items()]
-
-    results = []
-    with Pool(processes) as pool:
-        results = pool.map(process_query, tasks)
+    tasks = list(query_map.items())
+    chunksize = max(1, len(tasks) // (processes * 32))
 
-    with open(output_file, 'w') as f:
-        writer = csv.writer(f, delimiter='\t')
-        writer.writerow(['Query', 'Lineage', 'Taxonomic Level', 'Confidence'])
+    classified = 0
+    total = 0
+    with _pool_context().Pool(processes, initializer=_init_worker,
+                              initargs=(taxonomy, taxonomy_hierarchy, ref_abundance)) as pool, \
+            open(output_file, 'w', newline='', buffering=1 << 20) as f:
+        f.write('Query\tLineage\tTaxonomic Level\tConfidence\r\n')
         
-        classified = 0
-        for query, lineage, level, confidence in results:
+        batch = []
+        # imap keeps query_map order, so each row is written as it arrives
+        for query, lineage, level, confidence in pool.imap(process_query, tasks, chunksize=chunksize):
+            total += 1
             if lineage != 'Unknown':
                 classified += 1
-            writer.writerow([query, lineage, level, f"{confidence:.4f}"])
+            batch.append(f"{_quote_field(query)}\t{_quote_field(lineage)}\t{level}\t{confidence:.4f}\r\n")
+            if len(batch) >= 10000:
+                f.write(''.join(batch))
+                batch.clear()
+        f.write(''.join(batch))
 
     logging.info(f"Classification complete. Results saved to {output_file}")
-    logging.info(f"Classified: {classified}/{len(results)} ({classified/len(results):.1%})")
+    logging.info(f"Classified: {classified}/{total} ({classified/total:.1%})")
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(description="Advanced LCA/Best Match Taxonomic Classifier")
@@ -7,7 +7,7 @@ import argparse
 import logging
 import sys
 from collections import defaultdict, Counter
-from multiprocessing import Pool
+import multiprocessing
 
 # --- config / logging ---
 csv.field_size_limit(1024 * 1024 * 1024)  # tolerate giant Identifier fields
@@ -26,17 +26,22 @@ RANK_ALIAS = {
 }
 GCFA_RE = re.compile(r'GC[AF]_\d+(?:\.\d+)?(?:_PRJ[A-Z]+\d+)?')
 ACC_RE = re.compile(r'(NC_\d+\.\d+|NZ_[A-Z]{2}\d+\.\d+|NZ_[A-Z]{5}\d+\.\d+|CP\d+\.\d+|CM\d+\.\d+|[A-Z]{2}_\d+\.\d+)')
+_SEP_RE = re.compile(r'[;|]+')       # lineage field separators
+_TOK_RE = re.compile(r'[|\s]+')      # target-name token separators
 
 # --- globals for worker processes ---
 _TAX = None                 # dict: identifier -> taxid
-_HIER = None                # dict: taxid -> tuple/list of names by RANKS
+_HIER = None                # dict: taxid -> tuple of names by RANKS
 _REF_ABUND = None           # dict: ref_id -> count
+_TNAME_CACHE = {}           # dict: raw PAF tname -> taxid or None (per worker)
+_MISSING = object()
 
 def _init_worker(tax_map, hier_map, ref_abund):
-    global _TAX, _HIER, _REF_ABUND
+    global _TAX, _HIER, _REF_ABUND, _TNAME_CACHE
     _TAX = tax_map
     _HIER = hier_map
     _REF_ABUND = ref_abund
+    _TNAME_CACHE = {}
 
 # -------- taxonomy loaders --------
 
@@ -77,6 +82,8 @@ def load_taxonomy_file(taxonomy_file):
             taxid = (row.get('TaxID') or '').strip()
             if not taxid:
                 continue
+            # one shared string per taxid across all of its identifiers
+            taxid = sys.intern(taxid)
 
             # 1) capture any GCF/GCA-like accessions present in any column
             for v in row.values():
@@ -118,12 +125,10 @@ def _parse_lineage_to_names(lineage_raw):
 
     # Case A: rank:name pairs
     if ':' in s:
-        parts = re.split(r'[;|]+', s)
-        for part in parts:
-            part = part.strip()
-            if not part or ':' not in part:
+        for part in _SEP_RE.split(s):
+            rk, sep, nm = part.partition(':')
+            if not sep:
                 continue
-            rk, nm = part.split(':', 1)
             rk = RANK_ALIAS.get(rk.strip().lower(), None)
             nm = nm.strip()
             if not rk or not nm:
@@ -134,12 +139,10 @@ def _parse_lineage_to_names(lineage_raw):
 
     # Case B: k__/p__ style labels
     if '__' in s:
-        parts = re.split(r'[;|]+', s)
-        for part in parts:
-            part = part.strip()
-            if not part or '__' not in part:
+        for part in _SEP_RE.split(s):
+            rk_tag, sep, nm = part.partition('__')
+            if not sep:
                 continue
-            rk_tag, nm = part.split('__', 1)
             rk = RANK_ALIAS.get(rk_tag.strip().lower(), None)
             nm = nm.strip()
             if not rk or not nm:
@@ -149,15 +152,14 @@ def _parse_lineage_to_names(lineage_raw):
         return names_by_rank
 
     # Case C: plain names, assume ordered from superkingdom downward
-    parts = re.split(r'[;|]+', s)
-    seq = [p.strip() for p in parts if p.strip() and p.strip().upper() != 'NA']
+    seq = [p for p in (x.strip() for x in _SEP_RE.split(s)) if p and p.upper() != 'NA']
     for i, nm in enumerate(seq[:len(RANKS)]):
         names_by_rank[i] = nm
     return names_by_rank
 
 def load_taxonomy_hierarchy_file(taxonomy_hierarchy_file):
     """
-    Map TaxID -> names-by-rank (list aligned to RANKS).
+    Map TaxID -> names-by-rank (tuple aligned to RANKS).
     """
     hierarchy = {}
     with open(taxonomy_hierarchy_file, 'r', newline='') as f:
@@ -169,7 +171,7 @@ def load_taxonomy_hierarchy_file(taxonomy_hierarchy_file):
             lin = (row.get('Lineage') or '').strip()
             if not tid:
                 continue
-            hierarchy[tid] = _parse_lineage_to_names(lin)
+            hierarchy[sys.intern(tid)] = tuple(_parse_lineage_to_names(lin))
     logging.info(f"Loaded {len(hierarchy):,} taxonomy hierarchies")
     return hierarchy
 
@@ -184,25 +186,36 @@ def parse_paf_file(paf_file):
       query_map: dict q -> list of (tname, coverage)
       ref_counts: dict tname -> total alignments count (for weighting)
     """
-    query_map = defaultdict(list)
+    query_map = {}
     ref_counts = defaultdict(int)
+    last_q = None
+    hits = None
     with _opener(paf_file) as f:
         for line in f:
             if not line or line.startswith('#'):
                 continue
-            parts = line.rstrip('\n').split('\t')
+            # only the first 11 columns are used; leave the tag tail unsplit
+            # (int() ignores the newline left on an 11-column line)
+            parts = line.split('\t', 11)
             if len(parts) < 11:
                 continue
             qname = parts[0]
             try:
                 qlen = int(parts[1])
                 aln_block = int(parts[10])  # PAF col 11: alignment block length
-            except Exception:
+            except ValueError:
                 qlen = 0
                 aln_block = 0
-            tname = parts[5]
+            # references repeat across many hits; keep one copy of each name
+            tname = sys.intern(parts[5])
             cov = (aln_block / qlen) if qlen > 0 else 0.0
-            query_map[qname].append((tname, cov))
+            # minimap2 writes a query's hits consecutively; reuse its list
+            if qname != last_q:
+                hits = query_map.get(qname)
+                if hits is None:
+                    hits = query_map[qname] = []
+                last_q = qname
+            hits.append((tname, cov))
             ref_counts[tname] += 1
     logging.info(f"Processed {len(query_map):,} queries from PAF file")
     return query_map, ref_counts
@@ -228,9 +241,10 @@ def _generate_lookup_candidates(tname):
                 cands.append(xv)
 
     add(tname)
-    # split by whitespace and pipe
-    head = re.split(r'[|\s]+', tname)[0]
-    add(head)
+    # split by whitespace and pipe; plain accessions (the common case) have
+    # no separators, so their head is tname itself and was just added
+    if _TOK_RE.search(tname):
+        add(_TOK_RE.split(tname, 1)[0])
 
     # embedded accession patterns
     for g in GCFA_RE.findall(tname):
@@ -242,11 +256,18 @@ def _generate_lookup_candidates(tname):
 
 def _lookup_taxid(tname):
     """Try multiple normalized forms against the taxonomy map."""
+    # the same references recur across many queries; resolve each once
+    tid = _TNAME_CACHE.get(tname, _MISSING)
+    if tid is not _MISSING:
+        return tid
+    tid = None
     for cand in _generate_lookup_candidates(tname):
-        tid = _TAX.get(cand)
-        if tid:
-            return tid
-    return None
+        found = _TAX.get(cand)
+        if found:
+            tid = found
+            break
+    _TNAME_CACHE[tname] = tid
+    return tid
 
 def _weighted_lca(taxid_weights):
     """
@@ -258,17 +279,31 @@ def _weighted_lca(taxid_weights):
     if total_w <= 0:
         return "Unknown", "root", 0.0
 
+    # resolve each taxid's lineage once instead of once per rank
+    resolved = []
+    for tid, w in taxid_weights.items():
+        names = _HIER.get(tid)
+        if names:
+            resolved.append((w, names))
+
     chosen = []
     conf_product = 1.0
 
-    for r_idx, rank in enumerate(RANKS):
+    if len(resolved) == 1:
+        # a single lineage wins every rank outright, with confidence 1
+        w, names = resolved[0]
+        if w > 0:
+            for nm in names:
+                if not nm:
+                    break
+                chosen.append(nm)
+        return _lca_result(chosen, conf_product)
+
+    for r_idx in range(len(RANKS)):
         # gather weights per name at this rank
         name_w = defaultdict(float)
         denom = 0.0
-        for tid, w in taxid_weights.items():
-            names = _HIER.get(tid)
-            if not names:
-                continue
+        for w, names in resolved:
             nm = names[r_idx] if r_idx < len(names) else ''
             if nm:
                 name_w[nm] += w
@@ -280,6 +315,10 @@ def _weighted_lca(taxid_weights):
         chosen.append(best_name)
         conf_product *= conf_i
 
+    return _lca_result(chosen, conf_product)
+
+def _lca_result(chosen, conf_product):
+    """Format consensus names (superkingdom downward) as (lineage_str, level, confidence)."""
     if not chosen:
         return "Unknown", "root", 0.0
 
@@ -309,36 +348,46 @@ def _process_one(task):
 
 # -------- main driver --------
 
+def _pool_context():
+    """Prefer fork so workers inherit the lookup maps copy-on-write instead of unpickling them."""
+    if 'fork' in multiprocessing.get_all_start_methods():
+        return multiprocessing.get_context('fork')
+    return multiprocessing.get_context()
+
+def _tsv_row(fields):
+    """Format one row as a tab-delimited csv.writer would (minimal quoting, CRLF)."""
+    out = []
+    for v in fields:
+        if '"' in v or '\t' in v or '\r' in v or '\n' in v:
+            v = '"' + v.replace('"', '""') + '"'
+        out.append(v)
+    return '\t'.join(out) + '\r\n'
+
 def main_process(paf_file, taxonomy_file, hierarchy_file, output_file, processes=4):
     tax_map = load_taxonomy_file(taxonomy_file)
     hier_map = load_taxonomy_hierarchy_file(hierarchy_file)
     query_map, ref_abund = parse_paf_file(paf_file)
 
     tasks = list(query_map.items())
-    results = []
-    with Pool(processes, initializer=_init_worker, initargs=(tax_map, hier_map, ref_abund)) as pool:
-        for res in pool.imap_unordered(_process_one, tasks, chunksize=200):
-            results.append(res)
-
-    classified = sum(1 for _, lin, _, _ in results if lin != "Unknown")
-    with open(output_file, 'w', newline='') as f:
-        w = csv.writer(f, delimiter='\t')
-        w.writerow(['Query', 'Lineage', 'Taxonomic Level', 'Confidence'])
-        # Stable order: write in original query_map order
-        for q in query_map.keys():
-            # find result for q
-            # (results came unordered; index them quickly)
-            pass
-    # faster: build dict then write in order
-    resdict = {q: (lin, lvl, conf) for q, lin, lvl, conf in results}
-    with open(output_file, 'w', newline='') as f:
-        w = csv.writer(f, delimiter='\t')
-        w.writerow(['Query', 'Lineage', 'Taxonomic Level', 'Confidence'])
-        for q in query_map.keys():
-            lin, lvl, conf = resdict.get(q, ("Unknown", "root", 0.0))
-            w.writerow([q, lin, lvl, f"{conf:.4f}"])
-
-    total = len(results)
+    chunksize = max(1, len(tasks) // (processes * 32))
+    classified = 0
+    total = 0
+    with _pool_context().Pool(processes, initializer=_init_worker, initargs=(tax_map, hier_map, ref_abund)) as pool, \
+            open(output_file, 'w', newline='', buffering=1 << 20) as f:
+        f.write(_tsv_row(['Query', 'Lineage', 'Taxonomic Level', 'Confidence']))
+        batch = []
+        # imap yields in query_map order, so rows stream straight to the file
+        # without collecting and re-indexing every result first
+        for q, lin, lvl, conf in pool.imap(_process_one, tasks, chunksize=chunksize):
+            total += 1
+            if lin != "Unknown":
+                classified += 1
+            batch.append(_tsv_row([q, lin, lvl, f"{conf:.4f}"]))
+            if len(batch) >= 10000:
+                f.write(''.join(batch))
+                batch.clear()
+        f.write(''.join(batch))
+
     logging.info(f"Classification complete. Results saved to {output_file}")
     logging.info(f"Classified: {classified}/{total} ({(classified/total if total else 0):.1%})")
 
@@ -104,7 +104,8 @@ def load_scores(files: Iterable[pathlib.Path]) -> Dict[str, float]:
                 for line in handle:
                     if not line.strip():
                         continue
-                    parts = line.rstrip("\n").split("\t")
+                    # Columns past the query ID (the free-text comment) are unused.
+                    parts = line.rstrip("\n").split("\t", 5)
                     if len(parts) < 5:
                         continue
                     candidate = parts[4].strip()
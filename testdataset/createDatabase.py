@@ -1,14 +1,20 @@
-from os import listdir, path, makedirs, remove
-from os.path import isfile, join
+from os import scandir, path, makedirs, remove, replace, cpu_count
+from os.path import join
+from concurrent.futures import ThreadPoolExecutor
 import random
+import re
 import shutil
-import wget
+import subprocess
+import tempfile
+import threading
 import requests
-from bs4 import BeautifulSoup
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 from pathlib import Path
 import gzip
 import logging
 import time
+from urllib.parse import urlparse
 
 # Paths for input and output directories
 # Note: These paths should be adjusted according to your local setup
@@ -20,6 +26,21 @@ random.seed(0)
 
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 
+# One keep-alive session shared by every download thread; NCBI answers bursts
+# with 429, so requests are also capped per host.
+SESSION = requests.Session()
+_adapter = HTTPAdapter(pool_connections=32, pool_maxsize=32,
+                       max_retries=Retry(total=5, backoff_factor=1.0, status_forcelist=[429, 500, 502, 503, 504]))
+SESSION.mount("https://", _adapter)
+SESSION.mount("http://", _adapter)
+DOWNLOAD_WORKERS = 12
+REQUESTS_PER_HOST = 3
+_hostSlots = {}
+_hostSlotsLock = threading.Lock()
+# NCBI FTP index pages are plain autoindex listings; a regex over the raw bytes
+# is enough to pick out the genome archives.
+GENOMIC_HREF_RE = re.compile(rb'href="([^"]*genomic\.fna\.gz[^"]*)"')
+
 def main():
     selected_domain = input("Enter the domain you want to process (e.g., archaea, bacteria, fungi): ").strip().lower()
     selectedSequences = getSequences(selected_domain)
@@ -38,7 +59,15 @@ def _initialize():
 
 def splitSequences(selectedSequences, dstPathOfDatabaseSequences):
     logging.info("Starting to split and decompress sequences")
-    allFiles = [f for f in listdir(dstPathOfDatabaseSequences) if isfile(join(dstPathOfDatabaseSequences, f))]
+    # DirEntry.is_file() uses the type from the directory listing, avoiding a
+    # stat() per file on network filesystems.
+    allFiles = [e.name for e in scandir(dstPathOfDatabaseSequences) if e.is_file()]
+    # Index downloads by assembly name ("<accession>_<asm>_genomic.fna.gz")
+    # so each entry is a dict lookup rather than a scan of the listing.
+    filesByAssembly = {}
+    for f in allFiles:
+        filesByAssembly.setdefault(f.split("_genomic")[0], f)
+    toDecompress = []
     
     for x in selectedSequences:
         for domain in selectedSequences[x]:
@@ -46,26 +75,56 @@ def splitSequences(selectedSequences, dstPathOfDatabaseSequences):
             if not path.exists(dst):
                 makedirs(dst)
             for entry in selectedSequences[x][domain]:
-                fileName = entry.split("/")[-1]
-                matchingFiles = [f for f in allFiles if fileName in f]
-                if matchingFiles:
-                    fileToMove = matchingFiles[0]
+                fileName = entry.rstrip("/").split("/")[-1]
+                fileToMove = filesByAssembly.get(fileName)
+                if fileToMove:
                     source = join(dstPathOfDatabaseSequences, fileToMove)
                     destination = join(dst, fileToMove)
                     shutil.move(source, destination)
                     logging.info(f"Moved {fileToMove} to {domain} folder")
                     
                     if destination.endswith('.gz'):
-                        with gzip.open(destination, 'rb') as f_in:
-                            with open(destination[:-3], 'wb') as f_out:
-                                shutil.copyfileobj(f_in, f_out)
-                        remove(destination)  
-                        logging.info(f"Decompressed {fileToMove}")
+                        toDecompress.append(destination)
                 else:
                     logging.warning(f"File not found for entry: {entry}")
-    
+
+    # Decompress archives concurrently; the original is only removed once its
+    # output has been fully written.
+    with ThreadPoolExecutor(max_workers=cpu_count() or 1) as executor:
+        futures = {executor.submit(_decompress, gz): gz for gz in toDecompress}
+        for future, gz in futures.items():
+            try:
+                future.result()
+                logging.info(f"Decompressed {path.basename(gz)}")
+            except (OSError, EOFError, subprocess.CalledProcessError) as e:
+                logging.error(f"Error decompressing {gz}: {e}")
+
     logging.info("Finished splitting and decompressing sequences")
 
+def _decompress(source):
+    # pigz decodes on a separate thread from I/O and is several times faster
+    # than the gzip module; fall back to the standard library if it is missing.
+    # Output goes to a ".part" file first so a failed or truncated archive
+    # never leaves a partial genome behind under the final name.
+    target = source[:-3]
+    partial = target + ".part"
+    pigz = shutil.which("pigz")
+    try:
+        with open(partial, 'wb') as f_out:
+            if pigz:
+                subprocess.run([pigz, "-dc", source], stdout=f_out, check=True)
+            else:
+                with gzip.open(source, 'rb') as f_in:
+                    shutil.copyfileobj(f_in, f_out, 1 << 20)
+        replace(partial, target)
+    except BaseException:
+        try:
+            remove(partial)
+        except OSError:
+            pass
+        raise
+    remove(source)
+
 def getSequences(selected_domain):
     # Note: Assembly files need to be downloaded manually
     selectedSequences = {
@@ -73,7 +132,7 @@ def getSequences(selected_domain):
         "from_db": {}
     }
     
-    onlyfiles = [f for f in listdir(summariesPath) if isfile(join(summariesPath, f)) and f.endswith("assembly_summary.txt")]
+    onlyfiles = [e.name for e in scandir(summariesPath) if e.name.endswith("assembly_summary.txt") and e.is_file()]
     
     for fileName in onlyfiles:
         domain = fileName.split("_")[0].lower() 
@@ -101,34 +160,79 @@ def _getRandomEntries(listOfValues, content, singleColumn=False):
     return readsOfInterest
 
 def downloadSequences(selectedSequences, dst):
-    for domain in selectedSequences:
-        for entry in selectedSequences[domain]:
-            try:
-                r = requests.get(entry, timeout=10)
+    entries = [entry for domain in selectedSequences for entry in selectedSequences[domain]]
+    with ThreadPoolExecutor(max_workers=DOWNLOAD_WORKERS) as executor:
+        fileLinks = [fLink for links in executor.map(_listGenomicLinks, entries) for fLink in links]
+        if fileLinks and _downloadWithAria2(fileLinks, dst):
+            return
+        # Only fetch what aria2c (if it ran) did not finish; it leaves a
+        # .aria2 control file next to partial downloads.
+        fileLinks = [fLink for fLink in fileLinks
+                     if not path.exists(join(dst, fLink.split("/")[-1]))
+                     or path.exists(join(dst, fLink.split("/")[-1]) + ".aria2")]
+        for fLink, success in zip(fileLinks, executor.map(lambda fLink: _downloadFile(fLink, dst), fileLinks)):
+            if not success:
+                logging.error(f"Failed to download after multiple attempts: {fLink}")
+
+def _downloadWithAria2(fileLinks, dst):
+    # aria2c splits each file over several connections and pipelines the
+    # queue, sidestepping NCBI's per-connection throughput cap.
+    aria2c = shutil.which("aria2c")
+    if not aria2c:
+        return False
+    with tempfile.NamedTemporaryFile(mode="w", suffix=".txt") as fileList:
+        fileList.write("\n".join(fileLinks) + "\n")
+        fileList.flush()
+        cmd = [aria2c, "--input-file", fileList.name, "--dir", str(dst),
+               "--max-concurrent-downloads=8", "--max-connection-per-server=8", "--split=8",
+               "--retry-wait=5", "--max-tries=5", "--auto-file-renaming=false", "--console-log-level=warn"]
+        logging.info(f"Downloading {len(fileLinks)} files to {dst} with aria2c")
+        result = subprocess.run(cmd)
+    if result.returncode != 0:
+        logging.warning(f"aria2c exited with status {result.returncode}; retrying with requests")
+        return False
+    return True
+
+def _hostSlot(url):
+    host = urlparse(url).netloc
+    with _hostSlotsLock:
+        if host not in _hostSlots:
+            _hostSlots[host] = threading.Semaphore(REQUESTS_PER_HOST)
+        return _hostSlots[host]
+
+def _listGenomicLinks(entry):
+    try:
+        with _hostSlot(entry):
+            r = SESSION.get(entry, timeout=10)
+        r.raise_for_status()
+    except requests.RequestException as e:
+        logging.error(f"Error retrieving links from {entry}: {e}")
+        return []
+
+    links = []
+    for href in GENOMIC_HREF_RE.findall(r.content):
+        if b"from_genomic" not in href:
+            links.append(join(entry, href.decode()))
+    return links
+
+def _downloadFile(fLink, dst):
+    logging.info(f"Downloading {fLink} to {dst}")
+    target = join(dst, fLink.split("/")[-1])
+    attempts = 0
+    while attempts < 3:
+        try:
+            with _hostSlot(fLink), SESSION.get(fLink, stream=True, timeout=30) as r:
                 r.raise_for_status()
-                soup = BeautifulSoup(r.text, 'html.parser')
-                
-                for link in soup.find_all('a'):
-                    if "genomic.fna.gz" in link.get('href') and "from_genomic" not in link.get('href'):
-                        fLink = join(entry, link.get('href'))
-                        logging.info(f"Downloading {fLink} to {dst}")
-
-                        success = False
-                        attempts = 0
-                        while not success and attempts < 3: 
-                            try:
-                                wget.download(fLink, out=str(dst))
-                                success = True
-                            except Exception as e:
-                                attempts += 1
-                                logging.error(f"Error downloading {fLink}: {e}")
-                                time.sleep(5)  
-
-                        if not success:
-                            logging.error(f"Failed to download after multiple attempts: {fLink}")
-            
-            except requests.RequestException as e:
-                logging.error(f"Error retrieving links from {entry}: {e}")
+                with open(target, 'wb') as f:
+                    shutil.copyfileobj(r.raw, f, 1 << 20)
+            return True
+        except (requests.RequestException, OSError) as e:
+            attempts += 1
+            logging.error(f"Error downloading {fLink}: {e}")
+            if path.exists(target):
+                remove(target)
+            time.sleep(5)
+    return False
 
 if __name__ == "__main__":
     main()
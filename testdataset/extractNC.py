@@ -4,17 +4,26 @@ import csv
 from pathlib import Path
 from collections import defaultdict
 
+GCF_ID_PATTERN = re.compile(r'(GCF_\d+\.\d+)')
+SEQ_ID_PATTERN = re.compile(r'N[A-Z]_\w+\.\d+')
+
 def extract_identifiers(file_path):
-    gc_id = re.search(r'(GCF_\d+\.\d+)', file_path.name)
+    gc_id = GCF_ID_PATTERN.search(file_path.name)
     gc_id = gc_id.group(1) if gc_id else None
 
     ids = []
     with open(file_path, 'r') as f:
         for line in f:
             if line.startswith('>'):
-                id_match = re.search(r'(N[A-Z]_\w+\.\d+)', line)
+                # RefSeq headers lead with the accession, so try an anchored
+                # match on the first token before scanning the description.
+                tokens = line[1:].split(None, 1)
+                if tokens and SEQ_ID_PATTERN.fullmatch(tokens[0]):
+                    ids.append(tokens[0])
+                    continue
+                id_match = SEQ_ID_PATTERN.search(line)
                 if id_match:
-                    ids.append(id_match.group(1))
+                    ids.append(id_match.group(0))
 
     return gc_id, ids
 
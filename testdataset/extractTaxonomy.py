@@ -1,23 +1,34 @@
 import csv
+import json
+import os
+import pickle
+import time
 from pathlib import Path
+from urllib.error import HTTPError
 import logging
 from Bio import Entrez
 
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 
-def read_assembly_summary(file_path):
+# E-utilities accept comma-separated id lists; a few hundred per request keeps
+# URLs well within NCBI's limits.
+EFETCH_BATCH_SIZE = 200
+TAXONOMY_CACHE_NAME = "taxid_cache.json"
+
+def _parse_assembly_summary(file_path):
     taxonomy_dict = {}
     with open(file_path, 'r') as f:
         for line in f:
             if line.startswith('#'):
                 continue
-            fields = line.strip().split('\t')
+            # Only the first 20 columns are used; leave the rest unsplit.
+            fields = line.rstrip('\n').split('\t', 20)
             if len(fields) < 20:
                 continue
             assembly_accession = fields[0]
             species_taxid = fields[6]
             organism_name = fields[7]
-            ftp_path = fields[19].split('/')[-1]
+            ftp_path = fields[19].strip().split('/')[-1]
             taxonomy_dict[ftp_path] = {
                 'assembly_accession': assembly_accession,
                 'species_taxid': species_taxid,
@@ -25,53 +36,131 @@ def read_assembly_summary(file_path):
             }
     return taxonomy_dict
 
-def get_taxonomy(taxid):
-    handle = Entrez.efetch(db="taxonomy", id=str(taxid), retmode="xml")
-    records = Entrez.read(handle)
-    if records:
-        lineage = records[0]["LineageEx"]
-        full_lineage = {rank["Rank"]: rank["ScientificName"] for rank in lineage}
-        full_lineage["species"] = records[0]["ScientificName"]
-        return full_lineage
-    return None
+def read_assembly_summary(file_path):
+    """Parse an assembly summary, reusing a pickle cached beside it when the
+    summary's path, mtime and size are unchanged."""
+    file_path = Path(file_path)
+    stat = file_path.stat()
+    key = (str(file_path.resolve()), stat.st_mtime_ns, stat.st_size)
+    cache_path = file_path.with_suffix(".tax.pkl")
+    try:
+        with open(cache_path, 'rb') as f:
+            cached_key, taxonomy_dict = pickle.load(f)
+        if cached_key == key:
+            return taxonomy_dict
+    except FileNotFoundError:
+        pass
+    except (OSError, pickle.PickleError, EOFError, ValueError) as e:
+        logging.warning(f"Ignoring unreadable summary cache {cache_path}: {e}")
+
+    taxonomy_dict = _parse_assembly_summary(file_path)
+    try:
+        tmp_path = cache_path.with_suffix(cache_path.suffix + ".tmp")
+        with open(tmp_path, 'wb') as f:
+            pickle.dump((key, taxonomy_dict), f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, cache_path)
+    except OSError as e:
+        logging.warning(f"Could not write summary cache {cache_path}: {e}")
+    return taxonomy_dict
+
+def _efetch_taxonomy(taxids, max_attempts=5):
+    # NCBI answers bursts with HTTP 429; back off exponentially before retrying.
+    for attempt in range(max_attempts):
+        try:
+            handle = Entrez.efetch(db="taxonomy", id=",".join(taxids), retmode="xml")
+            try:
+                return Entrez.read(handle)
+            finally:
+                handle.close()
+        except HTTPError as e:
+            if e.code != 429 or attempt == max_attempts - 1:
+                raise
+            time.sleep(2 ** attempt)
+
+def load_taxonomy_cache(cache_path):
+    try:
+        with open(cache_path) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {}
+    except (OSError, ValueError) as e:
+        logging.warning(f"Ignoring unreadable taxonomy cache {cache_path}: {e}")
+        return {}
+
+def save_taxonomy_cache(cache_path, cache):
+    tmp_path = cache_path.with_suffix(cache_path.suffix + ".tmp")
+    with open(tmp_path, 'w') as f:
+        json.dump(cache, f)
+    os.replace(tmp_path, cache_path)
+
+def get_taxonomies(taxids, cache=None):
+    """Fetch full lineages for many taxids, one efetch request per batch.
+
+    Taxids already present in ``cache`` are not re-queried; newly fetched
+    lineages are added to it.
+    """
+    cache = {} if cache is None else cache
+    missing = [taxid for taxid in taxids if taxid not in cache]
+    for start in range(0, len(missing), EFETCH_BATCH_SIZE):
+        for record in _efetch_taxonomy(missing[start:start + EFETCH_BATCH_SIZE]):
+            full_lineage = {rank["Rank"]: rank["ScientificName"] for rank in record["LineageEx"]}
+            full_lineage["species"] = record["ScientificName"]
+            cache[str(record["TaxId"])] = full_lineage
+            # Merged taxids come back under their current id.
+            for alias in record.get("AkaTaxIds", []):
+                cache[str(alias)] = full_lineage
+    return {taxid: cache[taxid] for taxid in taxids if taxid in cache}
 
 def create_full_taxonomy_mapping(domain_path, summary_file, output_csv):
     logging.info(f"Processing {domain_path.name} assembly summary")
     taxonomy = read_assembly_summary(summary_file)
 
+    rows = []
+    for file in domain_path.glob('*.fna'):
+        file_prefix = file.stem.split('_genomic')[0]
+        if file_prefix in taxonomy:
+            row = {'accession': file_prefix, 'domain': domain_path.name}
+            row.update(taxonomy[file_prefix])
+            rows.append(row)
+        else:
+            logging.warning(f"No taxonomy found for {file_prefix}")
+
+    # Species repeat across assemblies and domains, so lineages are kept in a
+    # cache next to the assembly summaries and reused by later runs.
+    cache_path = summary_file.parent / TAXONOMY_CACHE_NAME
+    cache = load_taxonomy_cache(cache_path)
+    cached = len(cache)
+    lineages = get_taxonomies(list(dict.fromkeys(row['species_taxid'] for row in rows)), cache)
+    if len(cache) != cached:
+        save_taxonomy_cache(cache_path, cache)
+
     with open(output_csv, 'w', newline='') as csvfile:
         fieldnames = ['accession', 'domain', 'organism_name', 'species_taxid', 'assembly_accession',
                       'Kingdom', 'Phylum', 'Class', 'Order', 'Family', 'Genus', 'Species']
         writer = csv.DictWriter(csvfile, fieldnames=fieldnames)
         writer.writeheader()
 
-        for file in domain_path.iterdir():
-            if file.suffix == '.fna':
-                file_prefix = file.stem.split('_genomic')[0]
-                if file_prefix in taxonomy:
-                    row = {'accession': file_prefix, 'domain': domain_path.name}
-                    row.update(taxonomy[file_prefix])
-                    
-                    full_taxonomy = get_taxonomy(row['species_taxid'])
-                    if full_taxonomy:
-                        row['Kingdom'] = full_taxonomy.get('superkingdom', '')
-                        row['Phylum'] = full_taxonomy.get('phylum', '')
-                        row['Class'] = full_taxonomy.get('class', '')
-                        row['Order'] = full_taxonomy.get('order', '')
-                        row['Family'] = full_taxonomy.get('family', '')
-                        row['Genus'] = full_taxonomy.get('genus', '')
-                        row['Species'] = full_taxonomy.get('species', '')
-                    else:
-                        logging.warning(f"No full taxonomy found for {file_prefix}")
-                    
-                    writer.writerow(row)
-                else:
-                    logging.warning(f"No taxonomy found for {file_prefix}")
+        for row in rows:
+            full_taxonomy = lineages.get(row['species_taxid'])
+            if full_taxonomy:
+                row['Kingdom'] = full_taxonomy.get('superkingdom', '')
+                row['Phylum'] = full_taxonomy.get('phylum', '')
+                row['Class'] = full_taxonomy.get('class', '')
+                row['Order'] = full_taxonomy.get('order', '')
+                row['Family'] = full_taxonomy.get('family', '')
+                row['Genus'] = full_taxonomy.get('genus', '')
+                row['Species'] = full_taxonomy.get('species', '')
+            else:
+                logging.warning(f"No full taxonomy found for {row['accession']}")
+            
+            writer.writerow(row)
 
     logging.info(f"Full taxonomy mapping for {domain_path.name} has been written to {output_csv}")
 
 def main():
     Entrez.email = input("Enter your email (required for NCBI E-utilities): ")
+    # An API key raises the NCBI rate limit from 3 to 10 requests per second.
+    Entrez.api_key = os.environ.get("NCBI_API_KEY")
 
     domain_directory_input = input("Enter the path to the directory containing domain .fna files: ")
     summary_file_input = input("Enter the path to the assembly summary file: ")
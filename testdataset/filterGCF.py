@@ -1,57 +1,127 @@
 import os
 import glob
-from Bio import SeqIO
+from concurrent.futures import ProcessPoolExecutor
 
-def process_gcf_file(file_path):
-    sequences = list(SeqIO.parse(file_path, "fasta"))
-    total_bases = sum(len(seq) for seq in sequences)
-    target_bases = int(total_bases * 0.1)  # 10% of total bases
+LINE_WIDTH = 60
+BLOCK_SIZE = 1 << 22
+WRITE_BUFFER_SIZE = 1 << 20
+WHITESPACE = b" \t\r\n"
+HEADER_BYTE = ord(">")
+NEWLINE_BYTE = ord("\n")
+
+def record_lengths(file_path):
+    # Cheap first pass: segment sizes depend only on the record lengths, so
+    # scan the file in large binary blocks and count residues with bytes
+    # methods instead of iterating line by line.
+    lengths = []
+    in_header = False
+    at_line_start = True
+    with open(file_path, "rb") as handle:
+        while True:
+            block = handle.read(BLOCK_SIZE)
+            if not block:
+                break
+            pos = 0
+            while pos < len(block):
+                if in_header:
+                    newline = block.find(b"\n", pos)
+                    if newline < 0:
+                        pos = len(block)
+                        break
+                    in_header = False
+                    at_line_start = True
+                    pos = newline + 1
+                elif at_line_start and block[pos] == HEADER_BYTE:
+                    lengths.append(0)
+                    in_header = True
+                    pos += 1
+                else:
+                    header = block.find(b"\n>", pos)
+                    end = len(block) if header < 0 else header + 1
+                    if lengths:
+                        lengths[-1] += len(block[pos:end].translate(None, WHITESPACE))
+                    at_line_start = block[end - 1] == NEWLINE_BYTE
+                    pos = end
+    return lengths
+
+def segment_plan(lengths):
+    """Return (bases_to_extract, description) for each record."""
+    target_bases = int(sum(lengths) * 0.1)  # 10% of total bases
     
-    if len(sequences) == 1:
+    if len(lengths) == 1:
         # Case with only one sequence
-        seq = sequences[0]
-        trimmed_seq = seq[:target_bases]
-        trimmed_seq.id = seq.id
-        trimmed_seq.description = f"First 10% segment (1-{target_bases})"
-        return [trimmed_seq]
-    else:
-        # Case with multiple sequences
-        trimmed_sequences = []
-        bases_per_seq = target_bases // len(sequences)
-        remaining_bases = target_bases % len(sequences)
-        
-        for i, seq in enumerate(sequences):
-            if i == len(sequences) - 1:
-                bases_to_extract = bases_per_seq + remaining_bases
-            else:
-                bases_to_extract = bases_per_seq
-            
-            if len(seq) > bases_to_extract:
-                trimmed_seq = seq[:bases_to_extract]
-                trimmed_seq.id = seq.id
-                trimmed_seq.description = f"First {bases_to_extract} bases"
-            else:
-                trimmed_seq = seq[:]
-                trimmed_seq.id = seq.id
-                trimmed_seq.description = "Full sequence (shorter than target segment)"
-            trimmed_sequences.append(trimmed_seq)
+        return [(target_bases, f"First 10% segment (1-{target_bases})")]
+
+    # Case with multiple sequences
+    plan = []
+    bases_per_seq = target_bases // len(lengths) if lengths else 0
+    remaining_bases = target_bases % len(lengths) if lengths else 0
+    
+    for i, length in enumerate(lengths):
+        if i == len(lengths) - 1:
+            bases_to_extract = bases_per_seq + remaining_bases
+        else:
+            bases_to_extract = bases_per_seq
         
-        return trimmed_sequences
+        if length > bases_to_extract:
+            plan.append((bases_to_extract, f"First {bases_to_extract} bases"))
+        else:
+            plan.append((length, "Full sequence (shorter than target segment)"))
+    return plan
+
+def iter_trimmed_sequences(file_path):
+    """Yield (header, sequence) for the trimmed segment of each record.
+
+    Sequence lines past a record's segment are skipped without being
+    stored, so memory stays proportional to the emitted segment.
+    """
+    plan = segment_plan(record_lengths(file_path))
+    index = -1
+    header = None
+    parts = []
+    kept = limit = 0
+    with open(file_path) as handle:
+        for line in handle:
+            if line.startswith(">"):
+                if header is not None:
+                    yield header, "".join(parts)
+                index += 1
+                limit, description = plan[index]
+                tokens = line[1:].split(None, 1)
+                header = f"{tokens[0] if tokens else ''} {description}"
+                parts = []
+                kept = 0
+            elif header is not None and kept < limit:
+                chunk = line.rstrip()[:limit - kept]
+                parts.append(chunk)
+                kept += len(chunk)
+    if header is not None:
+        yield header, "".join(parts)
 
-def process_gcf_files(input_dir, output_dir):
+def write_fasta(handle, records):
+    # One write per record rather than one per wrapped line.
+    for header, seq in records:
+        lines = [f">{header}"]
+        lines.extend(seq[start:start + LINE_WIDTH] for start in range(0, len(seq), LINE_WIDTH))
+        handle.write("\n".join(lines) + "\n")
+
+def filter_gcf_file(file_path, output_path):
+    with open(output_path, "w", buffering=WRITE_BUFFER_SIZE) as output_file:
+        write_fasta(output_file, iter_trimmed_sequences(file_path))
+    return os.path.basename(file_path)
+
+def process_gcf_files(input_dir, output_dir, workers=None):
     if not os.path.exists(output_dir):
         os.makedirs(output_dir)
     
-    for file_path in glob.glob(os.path.join(input_dir, "GCF_*.fna")):
-        file_name = os.path.basename(file_path)
-        output_path = os.path.join(output_dir, file_name)
-        
-        trimmed_sequences = process_gcf_file(file_path)
-        
-        with open(output_path, "w") as output_file:
-            SeqIO.write(trimmed_sequences, output_file, "fasta")
-        
-        print(f"Processed: {file_name}")
+    input_paths = glob.glob(os.path.join(input_dir, "GCF_*.fna"))
+    output_paths = [os.path.join(output_dir, os.path.basename(p)) for p in input_paths]
+    
+    # Files are independent; each worker reads and writes its own pair so no
+    # sequence data crosses the process boundary.
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        for file_name in executor.map(filter_gcf_file, input_paths, output_paths, chunksize=4):
+            print(f"Processed: {file_name}")
 
 def main():
     # Prompt user for input and output directory paths
@@ -1,21 +1,35 @@
+import math
 import os
 import random
 
+BASES = ['A', 'C', 'G', 'T']
+SUBSTITUTIONS = {base: [b for b in BASES if b != base] for base in BASES}
+
+def mutation_positions(length, mutation_rate):
+    # Sample the gap to the next mutated position from a geometric
+    # distribution rather than drawing one random number per base.
+    if mutation_rate <= 0:
+        return
+    if mutation_rate >= 1:
+        yield from range(length)
+        return
+    log_keep = math.log1p(-mutation_rate)
+    position = -1
+    while True:
+        position += 1 + int(math.log(1.0 - random.random()) / log_keep)
+        if position >= length:
+            return
+        yield position
+
 def mutate_sequence(sequence, mutation_rate):
-    bases = ['A', 'C', 'G', 'T']
-    mutated_sequence = ""
+    mutated_bases = list(sequence)
     
-    for base in sequence:
-        if base not in bases:
-            mutated_sequence += base  # Keep non-DNA characters unchanged
-        elif random.random() < mutation_rate:
-            possible_bases = [b for b in bases if b != base]
-            new_base = random.choice(possible_bases)
-            mutated_sequence += new_base
-        else:
-            mutated_sequence += base
+    for position in mutation_positions(len(mutated_bases), mutation_rate):
+        base = mutated_bases[position]
+        if base in SUBSTITUTIONS:  # Keep non-DNA characters unchanged
+            mutated_bases[position] = random.choice(SUBSTITUTIONS[base])
     
-    return mutated_sequence
+    return "".join(mutated_bases)
 
 def get_mutation_rate():
     while True:
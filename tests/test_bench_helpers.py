@@ -0,0 +1,255 @@
+import os
+import sqlite3
+import sys
+import time
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(ROOT / "bench" / "lib"))
+sys.path.insert(0, str(ROOT / "bench" / "convert"))
+sys.path.insert(0, str(ROOT / "bench" / "tools"))
+
+import common
+import fix_superkingdom_taxids
+import prune_cache
+import subset_fasta
+
+
+def test_iter_fasta_records_spanning_blocks(tmp_path):
+    long_seq = "ACGT" * 50
+    fasta = tmp_path / "in.fa"
+    fasta.write_text(
+        ">first desc\n"
+        + "\n".join(long_seq[i : i + 7] for i in range(0, len(long_seq), 7))
+        + "\n>second\r\nAC\r\nGT\r\n>third\nTT\n"
+    )
+    records = list(subset_fasta.iter_fasta(fasta, block_size=5))
+    assert records == [
+        (b">first desc", long_seq.encode()),
+        (b">second", b"ACGT"),
+        (b">third", b"TT"),
+    ]
+
+
+def test_write_cami_profile_keeps_quoted_names_raw(tmp_path):
+    out = tmp_path / "profile.tsv"
+    rows = [
+        {
+            "taxid": "1164",
+            "rank": "species",
+            "taxpath": ["2", "1117", "", "1161", "1162", "1163", "1164"],
+            "taxpathsn": [
+                "Bacteria",
+                "Cyanobacteriota",
+                "",
+                "Nostocales",
+                "Nostocaceae",
+                "Trichormus",
+                '"Nostoc azollae" 0708',
+            ],
+            "percentage": 100.0,
+        }
+    ]
+    common.write_cami_profile(rows, str(out), "s1", "tool")
+    body = out.read_text().splitlines()[5:]
+    assert body == [
+        "1164\tspecies\t2|1117||1161|1162|1163|1164\t"
+        'Bacteria|Cyanobacteriota||Nostocales|Nostocaceae|Trichormus|"Nostoc azollae" 0708\t100.000000'
+    ]
+
+
+class FakeTaxonkit:
+    """Stand-in for ``common._run_taxonkit`` answering ``name2taxid`` queries."""
+
+    def __init__(self, known):
+        self.known = known
+        self.calls = []
+
+    def __call__(self, args, keys, taxdb):
+        self.calls.append(list(keys))
+        for key in keys:
+            if key in self.known:
+                yield f"{key}\t{self.known[key]}\tspecies"
+            else:
+                yield f"{key}\t\t"
+
+
+def _taxonkit_env(monkeypatch, tmp_path, cache_path, known):
+    taxdb = tmp_path / "taxdb"
+    taxdb.mkdir(exist_ok=True)
+    (taxdb / "nodes.dmp").write_text("1\t|\t1\t|\tno rank\t|\n")
+    fake = FakeTaxonkit(known)
+    monkeypatch.setattr(common, "TAXONKIT_CACHE", str(cache_path))
+    monkeypatch.setattr(common, "_TAXONKIT_MEMO", {})
+    monkeypatch.setattr(common, "_run_taxonkit", fake)
+    return str(taxdb), fake
+
+
+def test_taxonkit_cache_miss_then_insert(monkeypatch, tmp_path):
+    cache = tmp_path / "cache" / "taxonkit.sqlite"
+    taxdb, fake = _taxonkit_env(monkeypatch, tmp_path, cache, {"Escherichia coli": "562"})
+    result = common.taxonkit_name2taxid(["Escherichia coli", "Nothing here"], taxdb)
+    assert result == {"Escherichia coli": ("562", "species")}
+    assert fake.calls == [["Escherichia coli", "Nothing here"]]
+    conn = sqlite3.connect(cache)
+    rows = dict(conn.execute("SELECT key, value FROM taxonkit WHERE kind = 'name2taxid'"))
+    conn.close()
+    # Unresolved names are stored too, as an empty value.
+    assert rows == {"Escherichia coli": "562\tspecies", "Nothing here": ""}
+
+
+def test_taxonkit_cache_hit(monkeypatch, tmp_path):
+    cache = tmp_path / "taxonkit.sqlite"
+    taxdb, fake = _taxonkit_env(monkeypatch, tmp_path, cache, {"Escherichia coli": "562"})
+    common.taxonkit_name2taxid(["Escherichia coli", "Nothing here"], taxdb)
+    # A fresh process: empty memo, same on-disk cache.
+    monkeypatch.setattr(common, "_TAXONKIT_MEMO", {})
+    result = common.taxonkit_name2taxid(["Escherichia coli", "Nothing here"], taxdb)
+    assert result == {"Escherichia coli": ("562", "species")}
+    assert len(fake.calls) == 1
+
+
+def test_taxonkit_cache_invalidated_by_taxdb_change(monkeypatch, tmp_path):
+    cache = tmp_path / "taxonkit.sqlite"
+    taxdb, fake = _taxonkit_env(monkeypatch, tmp_path, cache, {"Escherichia coli": "562"})
+    common.taxonkit_name2taxid(["Escherichia coli"], taxdb)
+    (Path(taxdb) / "nodes.dmp").write_text("1\t|\t1\t|\tno rank\t|\n562\t|\t561\t|\tspecies\t|\n")
+    fake.known["Escherichia coli"] = "563"
+    monkeypatch.setattr(common, "_TAXONKIT_MEMO", {})
+    result = common.taxonkit_name2taxid(["Escherichia coli"], taxdb)
+    assert result == {"Escherichia coli": ("563", "species")}
+    assert fake.calls == [["Escherichia coli"], ["Escherichia coli"]]
+
+
+def test_taxonkit_cache_unwritable_falls_back(monkeypatch, tmp_path):
+    blocker = tmp_path / "not_a_dir"
+    blocker.write_text("")
+    taxdb, fake = _taxonkit_env(monkeypatch, tmp_path, blocker / "taxonkit.sqlite", {"Escherichia coli": "562"})
+    result = common.taxonkit_name2taxid(["Escherichia coli"], taxdb)
+    assert result == {"Escherichia coli": ("562", "species")}
+    assert fake.calls == [["Escherichia coli"]]
+    assert not (blocker / "taxonkit.sqlite").exists()
+
+
+FSK_TAXONOMY = """\
+TaxID\tParentTaxID\tRank\tName
+1\t1\tno rank\troot
+2\t1\tsuperkingdom\tBacteria
+1783272\t2\tkingdom\tBacillati
+1239\t1783272\tphylum\tBacillota
+1386\t1239\tgenus\tBacillus
+1423\t1386\tspecies\tBacillus subtilis
+2157\t1\tsuperkingdom\tArchaea
+28890\t2157\tphylum\tMethanobacteriota
+2172\t28890\tspecies\tMethanobrevibacter smithii
+"""
+FSK_TRUTH = """\
+@SampleID:\ttruth
+@@TAXID\tRANK\tTAXPATH\tTAXPATHSN\tPERCENTAGE
+2\tsuperkingdom\t2\tBacteria\t70.0
+2157\tsuperkingdom\t2157\tArchaea\t30.0
+"""
+FSK_HEADER = """\
+@SampleID:\ts1
+@Version:\t0.9.1
+@Ranks:\tsuperkingdom|phylum|class|order|family|genus|species
+@@TAXID\tRANK\tTAXPATH\tTAXPATHSN\tPERCENTAGE
+"""
+FSK_BODY = """\
+1239\tphylum\t1783272|1239\tBacillati|Bacillota\t60.000000
+28890\tphylum\t2157|28890\tArchaea|Methanobacteriota\t30.000000
+1386\tgenus\t1783272|1239|||||1386\tBacillati|Bacillota|||||Bacillus\t60.000000
+1423\tspecies\t1783272|1239|||||1386|1423\tBacillati|Bacillota|||||Bacillus|Bacillus subtilis\t55.000000
+2172\tspecies\t2157|28890||||||2172\tArchaea|Methanobacteriota|||||Methanobrevibacter smithii\t30.000000
+"""
+
+
+def _fix_superkingdoms(tmp_path, profile_text):
+    tax = tmp_path / "taxonomy.tsv"
+    tax.write_text(FSK_TAXONOMY)
+    truth = tmp_path / "truth.tsv"
+    truth.write_text(FSK_TRUTH)
+    profile = tmp_path / "profile.tsv"
+    profile.write_text(profile_text)
+    os.chmod(profile, 0o640)
+    taxonomy, names = fix_superkingdom_taxids.load_taxonomy(tax)
+    targets = fix_superkingdom_taxids.load_truth_superkingdoms(truth)
+    table = fix_superkingdom_taxids.build_superkingdom_table(taxonomy, targets)
+    fix_superkingdom_taxids.rewrite_profile(profile, names, targets, table)
+    assert os.stat(profile).st_mode & 0o777 == 0o640
+    return profile.read_text()
+
+
+# Expected outputs below were produced by the original single-pass rewrite.
+def test_fix_superkingdoms_matches_baseline(tmp_path):
+    out = _fix_superkingdoms(
+        tmp_path,
+        FSK_HEADER + "1783272\tsuperkingdom\t1783272\tBacillati\t60.000000\n" + FSK_BODY,
+    )
+    assert out == (
+        FSK_HEADER
+        + "2\tsuperkingdom\t2|NA|NA|NA|NA|NA|NA\tBacteria|NA|NA|NA|NA|NA|NA\t60.000000\n"
+        + "2157\tsuperkingdom\t2157|NA|NA|NA|NA|NA|NA\tArchaea|NA|NA|NA|NA|NA|NA\t30.000000\n"
+        + "1783272\tsuperkingdom\t1783272\tBacillati\t60.000000\n"
+        + FSK_BODY
+    )
+
+
+def test_fix_superkingdoms_without_priority_ranks_matches_baseline(tmp_path):
+    body = (
+        "1423\tstrain\t1423\tBacillus subtilis\t5.0\n"
+        "2172\tno rank\t2172\tMethanobrevibacter smithii\t3.0\n"
+    )
+    out = _fix_superkingdoms(tmp_path, "@@TAXID\tRANK\tTAXPATH\tTAXPATHSN\tPERCENTAGE\n" + body)
+    assert out == (
+        "@@TAXID\tRANK\tTAXPATH\tTAXPATHSN\tPERCENTAGE\n"
+        "2\tsuperkingdom\t2|NA|NA|NA|NA|NA|NA\tBacteria|NA|NA|NA|NA|NA|NA\t5.000000\n"
+        "2157\tsuperkingdom\t2157|NA|NA|NA|NA|NA|NA\tArchaea|NA|NA|NA|NA|NA|NA\t3.000000\n" + body
+    )
+
+
+def _age_tree(path, seconds):
+    stamp = time.time() - seconds
+    for dirpath, dirnames, filenames in os.walk(path):
+        for name in filenames:
+            os.utime(os.path.join(dirpath, name), (stamp, stamp))
+        os.utime(dirpath, (stamp, stamp))
+
+
+def test_prune_cache_reuses_size_of_settled_runs(tmp_path):
+    run = tmp_path / "run1"
+    (run / "sub").mkdir(parents=True)
+    (run / "a.fna").write_bytes(b"x" * 1000)
+    _age_tree(run, 2 * 86400)
+    assert [e.size_bytes for e in prune_cache.scan_cache(tmp_path)] == [1000]
+    # With the tree unchanged the manifest value is used, not a fresh walk.
+    manifest_path = tmp_path / prune_cache.SIZE_MANIFEST
+    manifest = prune_cache.load_size_manifest(manifest_path)
+    manifest["run1"]["size"] = 42
+    prune_cache.write_size_manifest(manifest_path, manifest)
+    assert [e.size_bytes for e in prune_cache.scan_cache(tmp_path)] == [42]
+
+
+def test_prune_cache_rescans_after_nested_write(tmp_path):
+    run = tmp_path / "run1"
+    (run / "sub").mkdir(parents=True)
+    (run / "a.fna").write_bytes(b"x" * 1000)
+    _age_tree(run, 2 * 86400)
+    run_mtime = os.stat(run).st_mtime
+    assert [e.size_bytes for e in prune_cache.scan_cache(tmp_path)] == [1000]
+    (run / "sub" / "b.fna").write_bytes(b"y" * 10000)
+    # The run directory's own mtime does not move for writes below sub/.
+    assert os.stat(run).st_mtime == run_mtime
+    assert [e.size_bytes for e in prune_cache.scan_cache(tmp_path)] == [11000]
+
+
+def test_prune_cache_rescans_recently_active_runs(tmp_path):
+    run = tmp_path / "run1"
+    run.mkdir()
+    (run / "a.fna").write_bytes(b"x" * 1000)
+    assert [e.size_bytes for e in prune_cache.scan_cache(tmp_path)] == [1000]
+    # Appending leaves every directory mtime alone; the run is still recent,
+    # so it is measured again instead of trusting the manifest.
+    with (run / "a.fna").open("ab") as handle:
+        handle.write(b"x" * 500)
+    assert [e.size_bytes for e in prune_cache.scan_cache(tmp_path)] == [1500]